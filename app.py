@@ -10,14 +10,15 @@ import textwrap
 from pandas import DataFrame, concat
 from flask_caching import Cache
 from modules.calc import get_options_data
-from modules.ticker_dwn import dwn_data
-from modules.layout import serve_layout
+from modules.producer import LockedRole, get_producer
+from modules.layout import serve_layout, format_ticker
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers import cron, combining
 from datetime import timedelta
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 from os import environ
+from threading import Lock
 
 load_dotenv()  # load environment variables from .env
 
@@ -44,15 +45,27 @@ cache = Cache(
     },
 )
 
-cache.clear()
-
 app.layout = serve_layout
 server = app.server
 
+producer = get_producer()
+# the Dash process that fills the shared cache and handles retries. It is not
+# tied to the download leader, which may be the bot's process
+cache_filler = LockedRole("dash_cache")
+
+# entries are keyed by snapshot version, so a refresh never empties the cache:
+# new versions fill in beside the old ones, which age out. Each view is
+# computed once per version, other requests for it wait on its lock
+view_locks = [Lock() for _ in range(32)]
+
+
+def view_key(ticker, expir, version=None):
+    return f"{ticker}_{expir}_{version or producer.version(ticker)}"
+
 
 @cache.memoize(timeout=60 * 15)  # cache charts for 15 min
-def analyze_data(ticker, expir):
-    # Analyze stored data of specified ticker and expiry
+def analyze_data(ticker, expir, version):
+    # Analyze stored data of specified ticker and expiry, version keys the cache
     # defaults: json format, timezone 'America/New_York'
     result = get_options_data(
         ticker,
@@ -63,11 +76,14 @@ def analyze_data(ticker, expir):
     return result if result else (None,) * 16
 
 
-def cache_data(ticker, expir):
-    data = analyze_data(ticker, expir)
-    if not cache.has(f"{ticker}_{expir}"):
+def cache_data(ticker, expir, version=None):
+    version = version or producer.version(ticker)
+    key = view_key(ticker, expir, version)
+    with view_locks[hash(key) % len(view_locks)]:
+        data = analyze_data(ticker, expir, version)
+    if not cache.has(key):
         cache.set(  # for client/server sync
-            f"{ticker}_{expir}",
+            key,
             {
                 "ticker": ticker,
                 "expiration": expir,
@@ -82,18 +98,32 @@ def cache_data(ticker, expir):
     return data
 
 
-def sensor(select=None):
-    # default: all tickers, json format
-    dwn_data(select, is_json=True)  # False for CSV
-    cache.clear()
+@producer.warm(
+    [
+        (format_ticker(ticker).lower(), expir)
+        for ticker in (environ.get("TICKERS") or "^SPX,^NDX,^RUT").strip().split(",")
+        for expir in ("all", "monthly", "opex", "0dte")
+    ]
+)
+def warm_view(ticker, expir, version):
+    if cache_filler.take():  # workers share the cache, one of them fills it
+        cache_data(ticker, expir, version)
 
 
 def check_for_retry():
     tickers = cache.get("retry")
-    if tickers:
-        print("\nRedownloading data due to missing greek exposure...\n")
-        sensor(select=tickers)
+    if tickers and cache_filler.take():
+        if producer.leader:
+            print("\nRedownloading data due to missing greek exposure...\n")
+            producer.refresh(select=tickers)
+        else:
+            print("\nMissing greek exposure, left to the producer's next refresh\n")
+        cache.delete("retry")  # a new snapshot gets a new version, retry only once
+
 
+# one process (or gunicorn worker) downloads data on the producer's
+# schedule, the others follow the snapshots it publishes
+producer.run()
 
 # respond to prompt if env variable not set
 response = environ.get("AUTO_RESPONSE")
@@ -102,26 +132,13 @@ if not response:
         response = input("\nDownload recent data? (y/n): ")
     except EOFError:
         response = "n"
-if response.strip().lower() == "y":  # download data at start
-    sensor()
+if response.strip().lower() == "y" and producer.leader:  # download data at start
+    producer.refresh()
 else:
     print("\nUsing existing data...\n")
 
-# schedule when to redownload data
+# schedule when to check for a retry
 sched = BackgroundScheduler(daemon=True)
-sched.add_job(
-    sensor,
-    combining.OrTrigger(
-        [
-            cron.CronTrigger.from_crontab(
-                "0,15,30,45 9-15 * * 0-4", timezone=ZoneInfo("America/New_York")
-            ),
-            cron.CronTrigger.from_crontab(
-                "0,15,30 16 * * 0-4", timezone=ZoneInfo("America/New_York")
-            ),
-        ]
-    ),
-)
 sched.add_job(
     check_for_retry,
     combining.OrTrigger(
@@ -301,7 +318,7 @@ def on_click(btn1, btn2, btn3, btn4, active_page, value, greek):
     State("live-chart", "figure"),
 )
 def check_cache_key(n_intervals, stock, expiration, fig):
-    data = cache.get(f"{stock.lower()}_{expiration}")
+    data = cache.get(view_key(stock.lower(), expiration))
     if not data and stock and expiration:
         cache_data(stock.lower(), expiration)
     if (
@@ -340,7 +357,7 @@ def check_cache_key(n_intervals, stock, expiration, fig):
     prevent_initial_call=True,
 )
 def handle_menu(btn1, btn2, stock, expiration, active_page, value, fig):
-    data = cache.get(f"{stock.lower()}_{expiration}")
+    data = cache.get(view_key(stock.lower(), expiration))
     if not data or not data["today_ddt"] or not fig["data"]:
         raise PreventUpdate
 
@@ -480,6 +497,8 @@ def update_live_chart(value, stock, expiration, active_page, refresh, toggle_dar
         call_ivs,
         put_ivs,
     ) = cache_data(stock.lower(), expiration)
+    if not producer.is_ready(stock.lower(), expiration):
+        print(f"cold read of {stock}/{expiration}, not warmed for this snapshot yet")
 
     # chart theme and layout
     xaxis, yaxis = dict(
@@ -3,10 +3,14 @@ from discord.ext import commands
 from dotenv import load_dotenv
 import os
 import asyncio
-from plot_options import generate_plots, set_discord_client
+from plot_options import load_plots, posted_view, set_discord_client
+from modules.metrics import start_loop_lag_monitor
 
 load_dotenv()
 DISCORD_TOKEN = ""
+# $load commands a user can run per LOAD_PER seconds
+LOAD_RATE = int(os.environ.get("LOAD_RATE") or 3)
+LOAD_PER = float(os.environ.get("LOAD_PER") or 60)
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -16,8 +20,10 @@ bot = commands.Bot(command_prefix="$", intents=intents)
 async def on_ready():
     print(f"Bot logged in as {bot.user}")
     set_discord_client(bot)
+    start_loop_lag_monitor(bot.loop)
 
 @bot.command()
+@commands.cooldown(LOAD_RATE, LOAD_PER, commands.BucketType.user)
 async def load(ctx, ticker: str, expiration: str, greek: str):
     ticker = ticker.upper()
     if ticker not in ["SPX", "NDX", "RUT"]:
@@ -31,9 +37,23 @@ async def load(ctx, ticker: str, expiration: str, greek: str):
     if greek.lower() not in ["delta", "gamma", "vanna", "charm"]:
         await ctx.send(f"Invalid Greek: {greek}. Must be delta, gamma, vanna, or charm.")
         return
+    charts = posted_view(ticker, expiration, greek.lower())
+    if charts:
+        # same snapshot as the charts already posted, point at them instead
+        links = dict.fromkeys(chart.message_url for chart in charts)
+        images = dict.fromkeys(chart.attachment_url for chart in charts)
+        await ctx.send("\n".join([f"Plots for {ticker}/{expiration}/{greek.lower()} are up to date:", *links, *images])[:2000])
+        return
     await ctx.send(f"Generating plots for {ticker}/{expiration}/{greek.lower()}...")
-    await generate_plots(specific_ticker=ticker, specific_exp=expiration, specific_greek=greek.lower())
+    await load_plots(ticker, expiration, greek.lower())
     await ctx.send(f"Plots for {ticker}/{expiration}/{greek.lower()} sent to the respective channel.")
 
+@load.error
+async def load_error(ctx, error):
+    if isinstance(error, commands.CommandOnCooldown):
+        await ctx.send(f"Too many requests, try again in {error.retry_after:.0f}s.")
+        return
+    raise error
+
 def run_bot():
     bot.run(DISCORD_TOKEN)
\ No newline at end of file
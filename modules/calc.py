@@ -2,16 +2,20 @@ import pandas as pd
 import numpy as np
 import orjson
 import modules.stats as stats
+from modules.chain import read_chain_columns, read_binary_snapshot, temp_path
 from yfinance import Ticker
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from dateparser.date import DateDataParser
 from warnings import simplefilter
 from calendar import monthrange
-from cachetools import cached, TTLCache
+from cachetools import cached, LRUCache, TTLCache
 from pathlib import Path
-from os import getcwd
-from re import compile
+from os import environ, getcwd, replace
+from threading import Condition, Lock
+from typing import NamedTuple
+from time import perf_counter
+from numba import config, set_num_threads
 import exchange_calendars as xcals
 from dateutil.parser import parse
 # Ignore warning for NaN values in dataframe
@@ -19,9 +23,12 @@ simplefilter(action="ignore", category=RuntimeWarning)
 
 pd.options.display.float_format = "{:,.4f}".format
 
-# Precompile regex patterns for performance
-_strike_regex = compile(r"\d[A-Z](\d+)\d\d\d")
-_exp_date_regex = compile(r"(\d{6})[CP]")
+# threads used for the exposure profiles, 1 keeps the serial kernel
+PROFILE_THREADS = int(environ.get("PROFILE_THREADS") or 1)
+# parallel kernels are launched one at a time, each already uses every thread
+_parallel_lock = Lock()
+# snapshot readers parse each file once, concurrent callers wait for it
+_snapshot_ready = Condition()
 
 
 @cached(cache=TTLCache(maxsize=16, ttl=60 * 60 * 4))  # in-memory cache for 4 hrs
@@ -64,41 +71,11 @@ def is_parsable(date):
         return False
 
 
-def format_data(data, today_ddt, tzinfo):
-    keys_to_keep = ["option", "iv", "open_interest", "delta", "gamma"]
-    data = pd.DataFrame([{k: d[k] for k in keys_to_keep if k in d} for d in data])
-    data = pd.concat(
-        [
-            data.rename(
-                columns={
-                    "option": "calls",
-                    "iv": "call_iv",
-                    "open_interest": "call_open_int",
-                    "delta": "call_delta",
-                    "gamma": "call_gamma",
-                }
-            )
-            .iloc[0::2]
-            .reset_index(drop=True),
-            data.rename(
-                columns={
-                    "option": "puts",
-                    "iv": "put_iv",
-                    "open_interest": "put_open_int",
-                    "delta": "put_delta",
-                    "gamma": "put_gamma",
-                }
-            )
-            .iloc[1::2]
-            .reset_index(drop=True),
-        ],
-        axis=1,
-    )
-    data["strike_price"] = data["calls"].str.extract(_strike_regex).astype(float)
-    data["expiration_date"] = data["calls"].str.extract(_exp_date_regex)
-    data["expiration_date"] = pd.to_datetime(
-        data["expiration_date"], format="%y%m%d"
-    ).dt.tz_localize(tzinfo) + timedelta(hours=16)
+def format_data(chain, today_ddt, tzinfo):
+    data = pd.DataFrame(chain)
+    data["expiration_date"] = pd.DatetimeIndex(
+        chain["expiration_date"].astype("datetime64[ns]")
+    ).tz_localize(tzinfo) + timedelta(hours=16)
 
     busday_counts = np.busday_count(
         today_ddt.date(),
@@ -115,23 +92,141 @@ def format_data(data, today_ddt, tzinfo):
     return data
 
 
-def calc_exposures(
-    option_data,
-    ticker,
-    expir,
-    first_expiry,
-    this_monthly_opex,
-    spot_price,
-    today_ddt,
-    today_ddt_string,
+def select_legs(legs, cond):
+    return {key: values[cond] for key, values in legs.items()}
+
+
+def compact_legs(option_data, buckets):
+    # stack calls and puts into one set of option legs, keeping only those
+    # that can contribute to the profiles: open interest, IV and time left
+    strike_prices = option_data["strike_price"].to_numpy()
+    time_till_exp = option_data["time_till_exp"].to_numpy()
+    legs = {
+        "strike": np.concatenate((strike_prices, strike_prices)),
+        "bucket": np.concatenate((buckets, buckets)),
+        "iv": np.concatenate(
+            (option_data["call_iv"].to_numpy(), option_data["put_iv"].to_numpy())
+        ),
+        "time_till_exp": np.concatenate((time_till_exp, time_till_exp)),
+        "open_int": np.concatenate(
+            (
+                option_data["call_open_int"].to_numpy(),
+                option_data["put_open_int"].to_numpy(),
+            )
+        ),
+        "is_call": np.repeat([True, False], strike_prices.size),
+    }
+    live_legs = (
+        (legs["open_int"] > 0) & (legs["iv"] > 0) & (legs["time_till_exp"] > 0)
+    )
+    # number of legs dropped is returned for reporting
+    return select_legs(legs, live_legs), live_legs.size - live_legs.sum()
+
+
+def calc_exposure_buckets(
+    levels, legs, n_buckets, yield_10yr, dividend_yield, threads=PROFILE_THREADS
 ):
+    # net delta, gamma, vanna and charm at each level for every bucket of legs,
+    # summed by one fused kernel so no levels x options matrix is allocated
+    args = (
+        levels,
+        legs["strike"],
+        legs["iv"],
+        legs["time_till_exp"],
+        legs["open_int"],
+        legs["is_call"],
+        legs["bucket"],
+        n_buckets,
+        yield_10yr,
+        dividend_yield,
+    )
+    if threads > 1:
+        with _parallel_lock:
+            set_num_threads(min(threads, config.NUMBA_NUM_THREADS))
+            profiles = stats.calc_exposure_buckets_parallel(*args)
+    else:
+        profiles = stats.calc_exposure_buckets(*args)
+    return tuple(profile / 10**9 for profile in profiles)
+
+
+def calc_profile_buckets(
+    option_data, ticker, spot_price, today_ddt, threads=PROFILE_THREADS
+):
+    # exposure profiles of the whole chain with one bucket per expiration.
+    # Every expiration view (0dte, opex, next expiry, next monthly...) is then
+    # a sum over a subset of the buckets
     dividend_yield = 0.0  # assume 0
     yield_10yr = check_ten_yr(today_ddt)
 
-    monthly_options_dates = [first_expiry, this_monthly_opex]
+    buckets, expirations = pd.factorize(option_data["expiration_date"], sort=True)
+    legs, dropped = compact_legs(option_data, buckets)
+    print(f"{ticker}: dropped {dropped} dead option legs")
+
+    levels = np.linspace(0.5 * spot_price, 1.5 * spot_price, 300)
+    delta, gamma, vanna, charm = calc_exposure_buckets(
+        levels, legs, expirations.size, yield_10yr, dividend_yield, threads
+    )
+    return {
+        "expirations": expirations,
+        "levels": levels,
+        "delta": delta,
+        "gamma": gamma,
+        "vanna": vanna,
+        "charm": charm,
+    }
+
+
+PROFILE_ARRAYS = ("levels", "delta", "gamma", "vanna", "charm")
+
+
+def shared_profile_buckets(version, option_data, ticker, spot_price, today_ddt):
+    # the profile buckets are the costly part of a snapshot. The first process
+    # to read a data file saves them to data/bin, keyed by the file's path,
+    # modification time and size, and the other processes reading the same
+    # file (Dash workers, the bot) load them instead of computing them again
+    path, mtime_ns, size = version
+    saved_path = Path(f"{getcwd()}/data/bin/{Path(path).name}.profiles.npz")
+    key = f"{path}:{mtime_ns}:{size}:{today_ddt.isoformat()}"
+    expirations = pd.factorize(option_data["expiration_date"], sort=True)[1]
+    try:
+        with np.load(saved_path) as saved:
+            if saved["key"] == key and len(saved["delta"]) == expirations.size:
+                return {
+                    "expirations": expirations,
+                    **{name: saved[name] for name in PROFILE_ARRAYS},
+                }
+    except (OSError, KeyError, ValueError):
+        pass  # none saved yet, or for an older file
+
+    profile_buckets = calc_profile_buckets(option_data, ticker, spot_price, today_ddt)
+    tmp_path = temp_path(saved_path)
+    try:
+        saved_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            arrays = {name: profile_buckets[name] for name in PROFILE_ARRAYS}
+            np.savez(f, key=key, **arrays)
+        replace(tmp_path, saved_path)
+    except OSError as e:
+        print(f"{ticker}: profile buckets not saved: {e}")
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return profile_buckets
+
+
+def sum_buckets(profile_buckets, cond):
+    # net delta, gamma, vanna and charm profiles of the expirations in cond
+    return tuple(
+        profile_buckets[greek][cond].sum(axis=0)
+        for greek in ["delta", "gamma", "vanna", "charm"]
+    )
+
+
+def calc_option_exposures(option_data, spot_price, today_ddt):
+    # exposure of every option at the spot price, added as columns
+    dividend_yield = 0.0  # assume 0
+    yield_10yr = check_ten_yr(today_ddt)
 
     strike_prices = option_data["strike_price"].to_numpy()
-    expirations = option_data["expiration_date"].to_numpy()
     time_till_exp = option_data["time_till_exp"].to_numpy()
     opt_call_ivs = option_data["call_iv"].to_numpy()
     opt_put_ivs = option_data["put_iv"].to_numpy()
@@ -159,9 +254,6 @@ def calc_exposures(
         dividend_yield,
     )
 
-    from_strike = 0.5 * spot_price
-    to_strike = 1.5 * spot_price
-
     # ---=== CALCULATE EXPOSURES ===---
     option_data["call_dex"] = (
         option_data["call_delta"].to_numpy() * call_open_interest * spot_price
@@ -254,6 +346,26 @@ def calc_exposures(
         option_data["call_cex"].to_numpy() - option_data["put_cex"].to_numpy()
     ) / 10**9
 
+
+    return option_data
+
+
+def calc_exposures(
+    option_data,
+    ticker,
+    expir,
+    first_expiry,
+    this_monthly_opex,
+    spot_price,
+    today_ddt,
+    today_ddt_string,
+    profile_buckets,
+):
+    monthly_options_dates = [first_expiry, this_monthly_opex]
+
+    from_strike = 0.5 * spot_price
+    to_strike = 1.5 * spot_price
+
     # group all options by strike / expiration then average their IVs
     df_agg_strike_mean = (
         option_data[["strike_price", "call_iv", "put_iv"]]
@@ -279,7 +391,7 @@ def calc_exposures(
     }
 
     # ---=== CALCULATE EXPOSURE PROFILES ===---
-    levels = np.linspace(from_strike, to_strike, 300).reshape(-1, 1)
+    levels = profile_buckets["levels"]
 
     totaldelta = {
         "all": np.array([]),
@@ -302,177 +414,36 @@ def calc_exposures(
         "ex_fri": np.array([]),
     }
 
-    # For each spot level, calculate greek exposure at that point
-    call_dp, call_cdf_dp, call_pdf_dp = stats.calc_dp_cdf_pdf(
-        levels,
-        strike_prices,
-        opt_call_ivs,
-        time_till_exp,
-        yield_10yr,
-        dividend_yield,
-    )
-    put_dp, put_cdf_dp, put_pdf_dp = stats.calc_dp_cdf_pdf(
-        levels,
-        strike_prices,
-        opt_put_ivs,
-        time_till_exp,
-        yield_10yr,
-        dividend_yield,
-    )
-    call_delta_ex = np.where(
-        nonzero_call_cond,
-        stats.calc_delta_ex(
-            levels,
-            time_till_exp,
-            dividend_yield,
-            "call",
-            call_open_interest,
-            call_cdf_dp,
-        ),
-        0,
-    )
-    put_delta_ex = np.where(
-        nonzero_put_cond,
-        stats.calc_delta_ex(
-            levels,
-            time_till_exp,
-            dividend_yield,
-            "put",
-            put_open_interest,
-            put_cdf_dp,
-        ),
-        0,
-    )
-    call_gamma_ex = np.where(
-        nonzero_call_cond,
-        stats.calc_gamma_ex(
-            levels,
-            opt_call_ivs,
-            time_till_exp,
-            dividend_yield,
-            call_open_interest,
-            call_pdf_dp,
-        ),
-        0,
-    )
-    put_gamma_ex = np.where(
-        nonzero_put_cond,
-        stats.calc_gamma_ex(
-            levels,
-            opt_put_ivs,
-            time_till_exp,
-            dividend_yield,
-            put_open_interest,
-            put_pdf_dp,
-        ),
-        0,
-    )
-    call_vanna_ex = np.where(
-        nonzero_call_cond,
-        stats.calc_vanna_ex(
-            levels,
-            opt_call_ivs,
-            time_till_exp,
-            dividend_yield,
-            call_open_interest,
-            call_dp,
-            call_pdf_dp,
-        ),
-        0,
-    )
-    put_vanna_ex = np.where(
-        nonzero_put_cond,
-        stats.calc_vanna_ex(
-            levels,
-            opt_put_ivs,
-            time_till_exp,
-            dividend_yield,
-            put_open_interest,
-            put_dp,
-            put_pdf_dp,
-        ),
-        0,
-    )
-    call_charm_ex = np.where(
-        nonzero_call_cond,
-        stats.calc_charm_ex(
-            levels,
-            opt_call_ivs,
-            time_till_exp,
-            yield_10yr,
-            dividend_yield,
-            "call",
-            call_open_interest,
-            call_dp,
-            call_cdf_dp,
-            call_pdf_dp,
-        ),
-        0,
-    )
-    put_charm_ex = np.where(
-        nonzero_put_cond,
-        stats.calc_charm_ex(
-            levels,
-            opt_put_ivs,
-            time_till_exp,
-            yield_10yr,
-            dividend_yield,
-            "put",
-            put_open_interest,
-            put_dp,
-            put_cdf_dp,
-            put_pdf_dp,
-        ),
-        0,
-    )
+    # expirations kept in this view, each one is a precomputed bucket
+    bucket_expirations = profile_buckets["expirations"]
+    in_view = bucket_expirations.isin(option_data["expiration_date"])
 
-    # delta exposure
-    totaldelta["all"] = (call_delta_ex.sum(axis=1) + put_delta_ex.sum(axis=1)) / 10**9
-    # gamma exposure
-    totalgamma["all"] = (call_gamma_ex.sum(axis=1) - put_gamma_ex.sum(axis=1)) / 10**9
-    # vanna exposure
-    totalvanna["all"] = (call_vanna_ex.sum(axis=1) - put_vanna_ex.sum(axis=1)) / 10**9
-    # charm exposure
-    totalcharm["all"] = (call_charm_ex.sum(axis=1) - put_charm_ex.sum(axis=1)) / 10**9
+    # For each spot level, greek exposure at that point
+    (
+        totaldelta["all"],
+        totalgamma["all"],
+        totalvanna["all"],
+        totalcharm["all"],
+    ) = sum_buckets(profile_buckets, in_view)
 
-    expirs_next_expiry = expirations == first_expiry
-    expirs_up_to_monthly_opex = expirations <= this_monthly_opex
     if expir != "0dte":
         # exposure for next expiry
-        totaldelta["ex_next"] = (
-            np.where(expirs_next_expiry, call_delta_ex, 0).sum(axis=1)
-            + np.where(expirs_next_expiry, put_delta_ex, 0).sum(axis=1)
-        ) / 10**9
-        totalgamma["ex_next"] = (
-            np.where(expirs_next_expiry, call_gamma_ex, 0).sum(axis=1)
-            - np.where(expirs_next_expiry, put_gamma_ex, 0).sum(axis=1)
-        ) / 10**9
-        totalvanna["ex_next"] = (
-            np.where(expirs_next_expiry, call_vanna_ex, 0).sum(axis=1)
-            - np.where(expirs_next_expiry, put_vanna_ex, 0).sum(axis=1)
-        ) / 10**9
-        totalcharm["ex_next"] = (
-            np.where(expirs_next_expiry, call_charm_ex, 0).sum(axis=1)
-            - np.where(expirs_next_expiry, put_charm_ex, 0).sum(axis=1)
-        ) / 10**9
+        (
+            totaldelta["ex_next"],
+            totalgamma["ex_next"],
+            totalvanna["ex_next"],
+            totalcharm["ex_next"],
+        ) = sum_buckets(profile_buckets, in_view & (bucket_expirations == first_expiry))
         if expir == "all":
             # exposure for next monthly opex
-            totaldelta["ex_fri"] = (
-                np.where(expirs_up_to_monthly_opex, call_delta_ex, 0).sum(axis=1)
-                + np.where(expirs_up_to_monthly_opex, put_delta_ex, 0).sum(axis=1)
-            ) / 10**9
-            totalgamma["ex_fri"] = (
-                np.where(expirs_up_to_monthly_opex, call_gamma_ex, 0).sum(axis=1)
-                - np.where(expirs_up_to_monthly_opex, put_gamma_ex, 0).sum(axis=1)
-            ) / 10**9
-            totalvanna["ex_fri"] = (
-                np.where(expirs_up_to_monthly_opex, call_vanna_ex, 0).sum(axis=1)
-                - np.where(expirs_up_to_monthly_opex, put_vanna_ex, 0).sum(axis=1)
-            ) / 10**9
-            totalcharm["ex_fri"] = (
-                np.where(expirs_up_to_monthly_opex, call_charm_ex, 0).sum(axis=1)
-                - np.where(expirs_up_to_monthly_opex, put_charm_ex, 0).sum(axis=1)
-            ) / 10**9
+            (
+                totaldelta["ex_fri"],
+                totalgamma["ex_fri"],
+                totalvanna["ex_fri"],
+                totalcharm["ex_fri"],
+            ) = sum_buckets(
+                profile_buckets, in_view & (bucket_expirations <= this_monthly_opex)
+            )
 
     # Find Delta Flip Point
     zero_cross_idx = np.where(np.diff(np.sign(totaldelta["all"])))[0]
@@ -494,12 +465,12 @@ def calc_exposures(
     )
 
     if zerodelta.size > 0:
-        zerodelta = zerodelta[0][0]
+        zerodelta = zerodelta[0]
     else:
         zerodelta = 0
         print("delta flip not found for", ticker, expir)
     if zerogamma.size > 0:
-        zerogamma = zerogamma[0][0]
+        zerogamma = zerogamma[0]
     else:
         zerogamma = 0
         print("gamma flip not found for", ticker, expir)
@@ -512,7 +483,7 @@ def calc_exposures(
         spot_price,
         from_strike,
         to_strike,
-        levels.ravel(),
+        levels,
         totaldelta,
         totalgamma,
         totalvanna,
@@ -524,40 +495,24 @@ def calc_exposures(
     )
 
 
-def get_options_data_json(ticker, expir, tz):
-    try:
-        # CBOE file format, json
-        ticker = ticker.replace("^", "")
-        ticker = ticker.lower()
-        with open(
-            Path(f"{getcwd()}/data/json/{ticker}_quotedata.json"), encoding="utf-8"
-        ) as json_file:
-            json_data = json_file.read()
-        data = pd.json_normalize(orjson.loads(json_data))
-    except orjson.JSONDecodeError as e:
-        print(f"{e}, {ticker} {expir} data is unavailable")
-        return
+class Snapshot(NamedTuple):
+    # parsed, typed and sorted option chain of one stored data file,
+    # shared by every expiration view of that file
+    version: tuple
+    spot_price: float
+    today_ddt: datetime
+    today_ddt_string: str
+    option_data: pd.DataFrame
+    expirations: pd.DatetimeIndex
+    first_expiry: datetime
+    this_monthly_opex: datetime
+    calendar_range: np.ndarray
+    profile_buckets: dict
 
-    # Get Spot
-    spot_price = data["data.current_price"][0].astype(float)
-
-    # Get Today's Date
-    today_date = DateDataParser(
-        settings={
-            "TIMEZONE": "UTC",
-            "TO_TIMEZONE": tz,
-            "RETURN_AS_TIMEZONE_AWARE": True,
-        }
-    ).get_date_data(str(data["timestamp"][0]))
-    today_ddt = today_date.date_obj - timedelta(minutes=15)
-    today_ddt_string = today_ddt.strftime("%Y %b %d, %I:%M %p %Z") + " (15min delay)"
-
-    option_data = format_data(
-        data["data.options"][0],
-        today_ddt,
-        today_date.date_obj.tzinfo,
-    )
 
+def build_snapshot(
+    version, ticker, tz, spot_price, today_ddt, today_ddt_string, option_data
+):
     # Get all unique expiration dates, sorted
     all_dates = option_data["expiration_date"].drop_duplicates().sort_values()
     first_expiry = all_dates.iat[0]
@@ -572,102 +527,136 @@ def get_options_data_json(ticker, expir, tz):
 
     this_monthly_opex, calendar_range = is_third_friday(first_expiry, tz)
 
-    # Filter options based on expir parameter
-    if expir == "monthly":
-        option_data = option_data[
-            option_data["expiration_date"]
-            <= (calendar_range[-1].replace(tzinfo=ZoneInfo(tz)) + timedelta(hours=16))
-        ]
-    elif expir == "0dte":
-        if len(all_dates) >= 1:
-            option_data = option_data[option_data["expiration_date"] == first_expiry]
-        else:
-            print("No expirations available for 0dte")
-            return
-    elif expir == "opex":
-        option_data = option_data[option_data["expiration_date"] <= this_monthly_opex]
-    elif expir == "all":
-        pass  # Keep all data
-    else:
-        # Handle specific date string (e.g., for "1dte")
-        try:
-            selected_date = parse(expir).date()
-            selected_expiry = [dt for dt in all_dates if dt.date() == selected_date]
-            if selected_expiry:
-                option_data = option_data[option_data["expiration_date"] == selected_expiry[0]]
-            else:
-                print(f"No expiration on {selected_date}")
-                return
-        except ValueError:
-            print(f"Invalid expir parameter: {expir}")
-            return
+    option_data = calc_option_exposures(
+        option_data.reset_index(drop=True), spot_price, today_ddt
+    )
+    profile_buckets = shared_profile_buckets(
+        version, option_data, ticker, spot_price, today_ddt
+    )
 
-    return calc_exposures(
+    return Snapshot(
+        version,
+        spot_price,
+        today_ddt,
+        today_ddt_string,
         option_data,
-        ticker,
-        expir,
+        profile_buckets["expirations"],
         first_expiry,
         this_monthly_opex,
+        calendar_range,
+        profile_buckets,
+    )
+
+
+def snapshot_dates(timestamp, tz):
+    # Get Today's Date
+    today_date = DateDataParser(
+        settings={
+            "TIMEZONE": "UTC",
+            "TO_TIMEZONE": tz,
+            "RETURN_AS_TIMEZONE_AWARE": True,
+        }
+    ).get_date_data(str(timestamp))
+    today_ddt = today_date.date_obj - timedelta(minutes=15)
+    today_ddt_string = today_ddt.strftime("%Y %b %d, %I:%M %p %Z") + " (15min delay)"
+    return today_ddt, today_ddt_string, today_date.date_obj.tzinfo
+
+
+# parsed snapshots are cached by file path, modification time and size,
+# so a data file is only read again once the downloader replaces it
+@cached(cache=LRUCache(maxsize=8), lock=_snapshot_ready, condition=_snapshot_ready)
+def read_json_snapshot(path, mtime_ns, size, ticker, tz):
+    # CBOE file format, json
+    with open(path, "rb") as json_file:
+        data = orjson.loads(json_file.read())
+
+    # Get Spot
+    spot_price = float(data["data"]["current_price"])
+
+    today_ddt, today_ddt_string, tzinfo = snapshot_dates(data["timestamp"], tz)
+    option_data = format_data(
+        read_chain_columns(data["data"]["options"]), today_ddt, tzinfo
+    )
+
+    return build_snapshot(
+        (path, mtime_ns, size),
+        ticker,
+        tz,
         spot_price,
         today_ddt,
         today_ddt_string,
+        option_data,
     )
 
 
-def get_options_data_csv(ticker, expir, tz):
-    try:
-        # CBOE file format, csv
-        with open(
-            Path(f"{getcwd()}/data/csv/{ticker}_quotedata.csv"), encoding="utf-8"
-        ) as csv_file:
-            next(csv_file)  # skip first line
-            spot_line = csv_file.readline()
-            date_line = csv_file.readline()
-            # Option data starts at line 4
-            option_data = pd.read_csv(
-                csv_file,
-                header=0,
-                names=[
-                    "expiration_date",
-                    "calls",
-                    "call_last_sale",
-                    "call_net",
-                    "call_bid",
-                    "call_ask",
-                    "call_vol",
-                    "call_iv",
-                    "call_delta",
-                    "call_gamma",
-                    "call_open_int",
-                    "strike_price",
-                    "puts",
-                    "put_last_sale",
-                    "put_net",
-                    "put_bid",
-                    "put_ask",
-                    "put_vol",
-                    "put_iv",
-                    "put_delta",
-                    "put_gamma",
-                    "put_open_int",
-                ],
-                usecols=lambda x: x
-                not in [
-                    "call_last_sale",
-                    "call_net",
-                    "call_bid",
-                    "call_ask",
-                    "call_vol",
-                    "put_last_sale",
-                    "put_net",
-                    "put_bid",
-                    "put_ask",
-                    "put_vol",
-                ],
-            )
-    except:  # handle error if data unavailable
-        print(ticker, expir, "data is unavailable")
-        return
+@cached(cache=LRUCache(maxsize=8), lock=_snapshot_ready, condition=_snapshot_ready)
+def read_bin_snapshot(path, mtime_ns, size, ticker, tz):
+    # columnar copy of the json written by the downloader, memory mapped
+    spot_price, timestamp, chain = read_binary_snapshot(path)
+
+    today_ddt, today_ddt_string, tzinfo = snapshot_dates(timestamp, tz)
+    option_data = format_data(chain, today_ddt, tzinfo)
+
+    return build_snapshot(
+        (path, mtime_ns, size),
+        ticker,
+        tz,
+        spot_price,
+        today_ddt,
+        today_ddt_string,
+        option_data,
+    )
+
+
+@cached(cache=LRUCache(maxsize=8), lock=_snapshot_ready, condition=_snapshot_ready)
+def read_csv_snapshot(path, mtime_ns, size, ticker, tz):
+    # CBOE file format, csv
+    with open(path, encoding="utf-8") as csv_file:
+        next(csv_file)  # skip first line
+        spot_line = csv_file.readline()
+        date_line = csv_file.readline()
+        # Option data starts at line 4
+        option_data = pd.read_csv(
+            csv_file,
+            header=0,
+            names=[
+                "expiration_date",
+                "calls",
+                "call_last_sale",
+                "call_net",
+                "call_bid",
+                "call_ask",
+                "call_vol",
+                "call_iv",
+                "call_delta",
+                "call_gamma",
+                "call_open_int",
+                "strike_price",
+                "puts",
+                "put_last_sale",
+                "put_net",
+                "put_bid",
+                "put_ask",
+                "put_vol",
+                "put_iv",
+                "put_delta",
+                "put_gamma",
+                "put_open_int",
+            ],
+            usecols=lambda x: x
+            not in [
+                "call_last_sale",
+                "call_net",
+                "call_bid",
+                "call_ask",
+                "call_vol",
+                "put_last_sale",
+                "put_net",
+                "put_bid",
+                "put_ask",
+                "put_vol",
+            ],
+        )
 
     # Get Spot
     spot_price = float(spot_line.split("Last:")[1].split(",")[0])
@@ -698,17 +687,6 @@ def get_options_data_csv(ticker, expir, tz):
     option_data["call_open_int"] = option_data["call_open_int"].astype(float)
     option_data["put_open_int"] = option_data["put_open_int"].astype(float)
 
-    all_dates = option_data["expiration_date"].drop_duplicates()
-    first_expiry = all_dates.iat[0]
-    if today_ddt > first_expiry:
-        # first date expired so, if available, use next date as 0DTE
-        try:
-            option_data = option_data[option_data["expiration_date"] != first_expiry]
-            first_expiry = all_dates.iat[1]
-        except IndexError:
-            print("next date unavailable. using expired date")
-    this_monthly_opex, calendar_range = is_third_friday(first_expiry, tz)
-
     busday_counts = np.busday_count(
         today_ddt.date(),
         option_data["expiration_date"].values.astype("datetime64[D]"),
@@ -719,15 +697,78 @@ def get_options_data_csv(ticker, expir, tz):
         busday_counts == 0, 1 / 252, busday_counts / 252
     )
 
+    return build_snapshot(
+        (path, mtime_ns, size),
+        ticker,
+        tz,
+        spot_price,
+        today_ddt,
+        today_ddt_string,
+        option_data,
+    )
+
+
+def get_snapshot(ticker, is_json, tz):
+    ticker = ticker.replace("^", "").lower()
+    path = (
+        Path(f"{getcwd()}/data/json/{ticker}_quotedata.json")
+        if is_json
+        else Path(f"{getcwd()}/data/csv/{ticker}_quotedata.csv")
+    )
+    stat = path.stat()
+    read_snapshot = read_json_snapshot if is_json else read_csv_snapshot
+    if is_json:
+        # prefer the binary copy unless the json was replaced after it
+        bin_path = Path(f"{getcwd()}/data/bin/{ticker}_quotedata.bin")
+        try:
+            bin_stat = bin_path.stat()
+            if bin_stat.st_mtime_ns >= stat.st_mtime_ns:
+                path, stat, read_snapshot = bin_path, bin_stat, read_bin_snapshot
+        except FileNotFoundError:
+            pass
+    return read_snapshot(str(path), stat.st_mtime_ns, stat.st_size, ticker, tz)
+
+
+def get_options_view(snapshot, ticker, expir, tz):
+    option_data = snapshot.option_data
+    all_dates = snapshot.expirations
+    first_expiry = snapshot.first_expiry
+    this_monthly_opex = snapshot.this_monthly_opex
+
+    # Filter options based on expir parameter
     if expir == "monthly":
         option_data = option_data[
             option_data["expiration_date"]
-            <= (calendar_range[-1].replace(tzinfo=ZoneInfo(tz)) + timedelta(hours=16))
+            <= (
+                snapshot.calendar_range[-1].replace(tzinfo=ZoneInfo(tz))
+                + timedelta(hours=16)
+            )
         ]
     elif expir == "0dte":
-        option_data = option_data[option_data["expiration_date"] == first_expiry]
+        if len(all_dates) >= 1:
+            option_data = option_data[option_data["expiration_date"] == first_expiry]
+        else:
+            print("No expirations available for 0dte")
+            return
     elif expir == "opex":
         option_data = option_data[option_data["expiration_date"] <= this_monthly_opex]
+    elif expir == "all":
+        pass  # Keep all data
+    else:
+        # Handle specific date string (e.g., for "1dte")
+        try:
+            selected_date = parse(expir).date()
+            selected_expiry = [dt for dt in all_dates if dt.date() == selected_date]
+            if selected_expiry:
+                option_data = option_data[
+                    option_data["expiration_date"] == selected_expiry[0]
+                ]
+            else:
+                print(f"No expiration on {selected_date}")
+                return
+        except ValueError:
+            print(f"Invalid expir parameter: {expir}")
+            return
 
     return calc_exposures(
         option_data,
@@ -735,15 +776,80 @@ def get_options_data_csv(ticker, expir, tz):
         expir,
         first_expiry,
         this_monthly_opex,
-        spot_price,
-        today_ddt,
-        today_ddt_string,
+        snapshot.spot_price,
+        snapshot.today_ddt,
+        snapshot.today_ddt_string,
+        snapshot.profile_buckets,
     )
 
 
+def get_options_data_json(ticker, expir, tz):
+    try:
+        snapshot = get_snapshot(ticker, True, tz)
+    except (OSError, orjson.JSONDecodeError, ValueError) as e:
+        print(f"{e}, {ticker} {expir} data is unavailable")
+        return
+    return get_options_view(snapshot, ticker.replace("^", "").lower(), expir, tz)
+
+
+def get_options_data_csv(ticker, expir, tz):
+    try:
+        snapshot = get_snapshot(ticker, False, tz)
+    except:  # handle error if data unavailable
+        print(ticker, expir, "data is unavailable")
+        return
+    return get_options_view(snapshot, ticker.replace("^", "").lower(), expir, tz)
+
+
 def get_options_data(ticker, expir, is_json, tz):
     return (
         get_options_data_json(ticker, expir, tz)
         if is_json
         else get_options_data_csv(ticker, expir, tz)
     )
+
+
+def benchmark_profiles(ticker, tz="America/New_York", repeat=5):
+    # time the full-chain exposure buckets for 1, 2, 4, ... numba threads
+    try:
+        snapshot = get_snapshot(ticker, True, tz)
+    except FileNotFoundError:  # only the csv snapshot was downloaded
+        snapshot = get_snapshot(ticker, False, tz)
+    option_data, spot_price = snapshot.option_data, snapshot.spot_price
+    buckets, expirations = pd.factorize(option_data["expiration_date"], sort=True)
+    legs, dropped = compact_legs(option_data, buckets)
+    levels = np.linspace(0.5 * spot_price, 1.5 * spot_price, 300)
+
+    thread_counts = [1]
+    while thread_counts[-1] * 2 <= config.NUMBA_NUM_THREADS:
+        thread_counts.append(thread_counts[-1] * 2)
+    if thread_counts[-1] != config.NUMBA_NUM_THREADS:
+        thread_counts.append(config.NUMBA_NUM_THREADS)
+
+    print(
+        f"\n{ticker.upper()}: {legs['strike'].size} legs x {levels.size} levels"
+        f" x {expirations.size} expirations ({dropped} dead legs dropped)"
+    )
+    timings = {}
+    for threads in thread_counts:
+        # first call compiles the kernel, keep it out of the timings
+        calc_exposure_buckets(levels, legs, expirations.size, 0.0, 0.0, threads)
+        runs = []
+        for _ in range(repeat):
+            start = perf_counter()
+            calc_exposure_buckets(levels, legs, expirations.size, 0.0, 0.0, threads)
+            runs.append(perf_counter() - start)
+        timings[threads] = min(runs)
+        print(
+            f"threads: {threads:>3}  best: {timings[threads] * 1000:8.2f} ms"
+            f"  speedup: {timings[1] / timings[threads]:5.2f}x"
+        )
+    return timings
+
+
+if __name__ == "__main__":
+    # python -m modules.calc spx ndx
+    import sys
+
+    for ticker in sys.argv[1:] or ["spx", "ndx"]:
+        benchmark_profiles(ticker)
@@ -0,0 +1,163 @@
+import numpy as np
+from pathlib import Path
+from uuid import uuid4
+
+
+# OCC option symbols are fixed width from the right: a 1-6 character root,
+# the expiration as yymmdd, C or P, then the strike times 1000 on 8 digits.
+# e.g. RUT250718C00950000 is the RUT 950 call expiring 2025-07-18
+def decode_occ_symbols(symbols):
+    # strike, expiration date and call flag of every symbol, in bulk
+    symbols = np.asarray(symbols, dtype="S")
+    lengths = np.char.str_len(symbols)
+    if symbols.size and lengths.min() < 16:
+        raise ValueError("option symbols must have a root and 15 trailing characters")
+    chars = symbols.view(np.uint8).reshape(symbols.size, symbols.itemsize)
+    # last 15 characters of each symbol, right aligned whatever the root length
+    tail = np.take_along_axis(chars, lengths[:, None] + np.arange(-15, 0), axis=1)
+    is_call = tail[:, 6] == ord("C")
+    digits = tail.astype(np.int64) - ord("0")
+
+    strike = digits[:, 7:] @ 10 ** np.arange(7, -1, -1) / 1000
+    year, month, day = (digits[:, i] * 10 + digits[:, i + 1] for i in (0, 2, 4))
+    # months since 1970-01, then days within the month
+    months = (year + 30) * 12 + month - 1
+    expiration = months.astype("datetime64[M]").astype("datetime64[D]") + (day - 1)
+
+    return strike, expiration, is_call
+
+
+# fields read for every option of a CBOE json chain, and the names of the
+# columns they become for the call and put of each series
+OPTION_FIELDS = {
+    "iv": ("call_iv", "put_iv"),
+    "open_interest": ("call_open_int", "put_open_int"),
+    "delta": ("call_delta", "put_delta"),
+    "gamma": ("call_gamma", "put_gamma"),
+}
+
+
+def read_chain_columns(options):
+    # typed columns of a decoded CBOE option list, one row per strike and
+    # expiration with the call and put side by side
+    n = len(options)
+    symbols = np.empty(n, dtype="S32")
+    fields = {field: np.empty(n) for field in OPTION_FIELDS}
+    iv, open_interest, delta, gamma = fields.values()
+    # single pass over the records, missing values become NaN
+    for i, option in enumerate(options):
+        symbols[i] = option["option"]
+        iv[i] = option.get("iv")
+        open_interest[i] = option.get("open_interest")
+        delta[i] = option.get("delta")
+        gamma[i] = option.get("gamma")
+
+    strike, expiration, is_call = decode_occ_symbols(symbols)
+    order = pair_calls_puts(symbols, is_call)
+    calls, puts = order[0::2], order[1::2]
+
+    chain = {
+        "calls": symbols[calls].astype(str),
+        "puts": symbols[puts].astype(str),
+        "strike_price": strike[calls],
+        "expiration_date": expiration[calls],
+    }
+    for field, (call_column, put_column) in OPTION_FIELDS.items():
+        chain[call_column] = fields[field][calls]
+        chain[put_column] = fields[field][puts]
+    return chain
+
+
+def pair_calls_puts(symbols, is_call):
+    # order of the options that puts each call right before the put of the
+    # same series (root, expiration and strike). CBOE lists them that way
+    # already, so the order is checked and only re-sorted when it breaks
+    n = symbols.size
+    lengths = np.char.str_len(symbols)
+    chars = symbols.view(np.uint8).reshape(n, symbols.itemsize).copy()
+    # blank the call/put character so both sides of a series compare equal
+    chars[np.arange(n), lengths - 9] = ord("_")
+    series = chars.view(symbols.dtype).ravel()
+
+    order = np.arange(n)
+    if not is_paired(series, is_call):
+        order = np.lexsort((~is_call, series))
+        if not is_paired(series[order], is_call[order]):
+            raise ValueError("option chain has calls or puts without a pair")
+    return order
+
+
+def is_paired(series, is_call):
+    return (
+        series.size % 2 == 0
+        and is_call[0::2].all()
+        and not is_call[1::2].any()
+        and (series[0::2] == series[1::2]).all()
+    )
+
+
+# Binary snapshot layout: a fixed header, then one contiguous column per
+# field. Each column starts on a 64 byte boundary so every process can map
+# the file and use the columns in place, with nothing to parse
+SNAPSHOT_MAGIC = b"GFLOWS01"
+SNAPSHOT_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("rows", "<i8"),
+        ("spot_price", "<f8"),
+        ("timestamp", "S32"),
+    ]
+)
+SNAPSHOT_COLUMNS = {
+    "strike_price": np.dtype("<f8"),
+    "expiration_date": np.dtype("<M8[D]"),
+    "call_iv": np.dtype("<f8"),
+    "put_iv": np.dtype("<f8"),
+    "call_open_int": np.dtype("<f8"),
+    "put_open_int": np.dtype("<f8"),
+    "call_delta": np.dtype("<f8"),
+    "put_delta": np.dtype("<f8"),
+    "call_gamma": np.dtype("<f8"),
+    "put_gamma": np.dtype("<f8"),
+}
+
+
+def write_binary_snapshot(path, data):
+    # columnar copy of a decoded CBOE json payload. It is written in place,
+    # the caller swaps it in
+    chain = read_chain_columns(data["data"]["options"])
+    header = np.zeros(1, dtype=SNAPSHOT_HEADER)
+    header["magic"] = SNAPSHOT_MAGIC
+    header["rows"] = chain["strike_price"].size
+    header["spot_price"] = data["data"]["current_price"]
+    header["timestamp"] = str(data["timestamp"])
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        for column, dtype in SNAPSHOT_COLUMNS.items():
+            f.write(bytes(-f.tell() % 64))
+            f.write(np.ascontiguousarray(chain[column], dtype=dtype).tobytes())
+
+
+def temp_path(path):
+    # unique file next to path, so os.replace can swap it in atomically
+    return path.with_name(f".{path.name}.{uuid4().hex}.tmp")
+
+
+def read_binary_snapshot(path):
+    # spot price, CBOE timestamp and read-only columns mapped from the file
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    header = np.frombuffer(buffer, dtype=SNAPSHOT_HEADER, count=1)[0]
+    if header["magic"] != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a binary snapshot")
+    rows = int(header["rows"])
+
+    chain = {}
+    offset = SNAPSHOT_HEADER.itemsize
+    for column, dtype in SNAPSHOT_COLUMNS.items():
+        offset += -offset % 64
+        chain[column] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+        offset += rows * dtype.itemsize
+    return float(header["spot_price"]), header["timestamp"].decode(), chain
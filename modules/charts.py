@@ -0,0 +1,512 @@
+import numpy as np
+import pandas as pd
+from cachetools import LRUCache
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
+from multiprocessing import get_all_start_methods, get_context
+from io import BytesIO
+from os import cpu_count, environ
+from threading import Lock
+from typing import NamedTuple
+from zoneinfo import ZoneInfo
+
+# charts are described in the main process by a ChartSpec holding only numpy
+# arrays and plain values, then drawn and saved in worker processes
+RENDER_WORKERS = int(environ.get("RENDER_WORKERS") or cpu_count() or 1)
+# figures kept per render worker, one per chart drawn recently. A template
+# takes about 4 MB, and each chart is always drawn by the same worker, so
+# the pool keeps every chart once: about 450 MB for the 110 charts of the
+# default tickers, split between the workers, and at most 4 MB times this
+# size in any one of them
+TEMPLATE_CACHE_SIZE = int(environ.get("TEMPLATE_CACHE_SIZE") or 128)
+SCALE = 10**9
+
+
+class ChartSpec(NamedTuple):
+    ticker: str
+    exp: str
+    greek: str
+    value: str
+    title: str
+    when: str  # time of the snapshot
+    spot: float
+    spot_line: bool  # whether the spot is marked on the chart
+    artists: tuple  # (axes method, args, kwargs), drawn in order
+    xlim: tuple
+    xtz: str  # timezone of a date axis, dates are given as naive UTC
+    xticks: tuple  # (ticks, labels), empty to keep the default ticks
+    xlabel: str
+    ylabel: str
+    legend_title: str
+
+
+def plain(x):
+    # numpy copy of an index or series, aware dates as naive UTC which
+    # matplotlib places exactly where it places the aware ones
+    if isinstance(x, datetime):
+        x = pd.Timestamp(x)
+    if isinstance(x, (pd.DatetimeIndex, pd.Timestamp)) and x.tz is not None:
+        x = x.tz_convert("UTC").tz_localize(None)
+    return x.to_numpy() if hasattr(x, "to_numpy") else np.asarray(x)
+
+
+def chart_spec(ticker, exp, greek, value, data, tomorrow):
+    # what generate_plots draws for one visualization, None when skipped
+    (
+        df,
+        today_ddt,
+        today_ddt_string,
+        monthly_options_dates,
+        spot_price,
+        from_strike,
+        to_strike,
+        levels,
+        totaldelta,
+        totalgamma,
+        totalvanna,
+        totalcharm,
+        zerodelta,
+        zerogamma,
+        call_ivs,
+        put_ivs,
+    ) = data
+    if value == "Implied Volatility Average" and exp in ("0dte", "1dte"):
+        return None
+
+    date_condition = "Profile" not in value and value != "Implied Volatility Average"
+    if date_condition:
+        if not isinstance(from_strike, (int, float)) or not isinstance(
+            to_strike, (int, float)
+        ):
+            return None
+        df_agg = df.groupby(["strike_price"]).sum(numeric_only=True)
+        lower_strike = max(int(spot_price - 300), df_agg.index.min())
+        upper_strike = min(int(spot_price + 300), df_agg.index.max())
+        strikes = np.arange(lower_strike, upper_strike + 5, 5)
+        df_agg = df_agg.reindex(strikes, method="ffill").fillna(0)
+    else:
+        df_agg = df.groupby(["expiration_date"]).sum(numeric_only=True)
+    if df_agg.empty:
+        return None
+
+    if "Calls/Puts" in value or value == "Implied Volatility Average":
+        key = "strike" if date_condition else "exp"
+        if not (
+            isinstance(call_ivs, dict)
+            and isinstance(put_ivs, dict)
+            and key in call_ivs
+            and key in put_ivs
+        ):
+            return None
+        call_ivs_data, put_ivs_data = plain(call_ivs[key]), plain(put_ivs[key])
+
+    if "Profile" in value and exp == "0dte" and len(df_agg.index) <= 1:
+        return None
+
+    name = value.split()[1] if "Absolute" in value else value.split()[0]
+    name_to_vals = {
+        "Delta": (f"{name} Exposure (price / 1% move)", zerodelta),
+        "Gamma": (f"{name} Exposure (delta / 1% move)", zerogamma),
+        "Vanna": (f"{name} Exposure (delta / 1% IV move)", 0),
+        "Charm": (f"{name} Exposure (delta / day til expiry)", 0),
+        "Implied": ("Implied Volatility (IV) Average", 0),
+    }
+    y_title, zeroflip = name_to_vals[name]
+
+    x = plain(df_agg.index)
+    artists = []
+    if "Absolute" in value:
+        artists.append(
+            (
+                "bar",
+                (x, plain(df_agg[f"total_{name.lower()}"])),
+                dict(width=4, label=f"{name} Exposure", alpha=0.8, color="#2B5078"),
+            )
+        )
+    elif "Calls/Puts" in value:
+        for side, color in (("call", "#2B5078"), ("put", "#9B5C30")):
+            artists.append(
+                (
+                    "bar",
+                    (x, plain(df_agg[f"{side}_{name[:1].lower()}ex"] / SCALE)),
+                    dict(
+                        width=4,
+                        label=f"{side.title()} {name}",
+                        alpha=0.8,
+                        color=color,
+                    ),
+                )
+            )
+    elif value == "Implied Volatility Average":
+        for label, ivs, color in (
+            ("Put IV", put_ivs_data, "#C44E52"),
+            ("Call IV", call_ivs_data, "#32A3A3"),
+        ):
+            artists.append(("plot", (x, ivs * 100), dict(label=label, color=color)))
+            artists.append(
+                ("fill_between", (x, ivs * 100), dict(alpha=0.3, color=color))
+            )
+    else:
+        totals = {
+            "Delta": totaldelta,
+            "Gamma": totalgamma,
+            "Vanna": totalvanna,
+            "Charm": totalcharm,
+        }[name]
+        all_ex, ex_next, ex_fri = totals["all"], totals["ex_next"], totals["ex_fri"]
+        if not (all_ex.size > 0 and ex_next.size > 0 and ex_fri.size > 0):
+            return None
+        levels = plain(levels)
+        artists.append(("plot", (levels, all_ex), dict(label="All Expiries")))
+        artists.append(("plot", (levels, ex_fri), dict(label="Next Monthly Expiry")))
+        artists.append(("plot", (levels, ex_next), dict(label="Next Expiry")))
+        if name in ["Charm", "Vanna"]:
+            min_n = sorted([all_ex.min(), ex_fri.min(), ex_next.min()])
+            max_n = sorted([all_ex.max(), ex_fri.max(), ex_next.max()])
+            if min_n[0] < 0:
+                artists.append(
+                    ("axhspan", (0, min_n[0] * 1.5), dict(facecolor="red", alpha=0.1))
+                )
+            if max_n[2] > 0:
+                artists.append(
+                    ("axhspan", (0, max_n[2] * 1.5), dict(facecolor="green", alpha=0.1))
+                )
+            artists.append(
+                (
+                    "axhline",
+                    (),
+                    dict(y=0, color="dimgray", linestyle="--", label=f"{name} Flip"),
+                )
+            )
+        elif zeroflip > 0:
+            artists.append(
+                (
+                    "axvline",
+                    (),
+                    dict(
+                        x=zeroflip,
+                        color="dimgray",
+                        linestyle="--",
+                        label=f"{name} Flip: {zeroflip:,.0f}",
+                    ),
+                )
+            )
+            artists.append(
+                ("axvspan", (from_strike, zeroflip), dict(facecolor="red", alpha=0.1))
+            )
+            artists.append(
+                ("axvspan", (zeroflip, to_strike), dict(facecolor="green", alpha=0.1))
+            )
+
+    if date_condition:
+        val = ((spot_price // 50) + 1) * 50
+        xlim = (val - 300, val + 300)
+        x_ticks = np.arange(int(val - 300), int(val + 305), 50)
+        xticks = (x_ticks, [f"{int(x)}" for x in x_ticks])
+    else:
+        xlim = (plain(today_ddt), plain(today_ddt + timedelta(days=31)))
+        xticks = ()
+    # dates are labelled in the timezone of the snapshot, as matplotlib does
+    # when given the aware dates
+    xtz = "" if date_condition else str(today_ddt.tzinfo)
+
+    date_formats = {
+        "monthly": (
+            monthly_options_dates[0].strftime("%Y %b")
+            if monthly_options_dates
+            else "N/A"
+        ),
+        "opex": (
+            monthly_options_dates[1].strftime("%Y %b %d")
+            if len(monthly_options_dates) > 1
+            else "N/A"
+        ),
+        "0dte": (
+            monthly_options_dates[0].strftime("%Y %b %d")
+            if monthly_options_dates
+            else "N/A"
+        ),
+        "1dte": tomorrow.strftime("%Y %b %d"),
+        "all": "All Expirations",
+    }
+    return ChartSpec(
+        ticker=ticker,
+        exp=exp,
+        greek=greek,
+        value=value,
+        title=f"{ticker} {value}, {today_ddt_string} for {exp}".replace("<br>", " "),
+        when=today_ddt_string.replace("<br>", " "),
+        spot=spot_price,
+        spot_line=date_condition,  # drawn after the artists
+        artists=tuple(artists),
+        xlim=xlim,
+        xtz=xtz,
+        xticks=xticks,
+        xlabel="Strike" if date_condition else "Date",
+        ylabel=y_title,
+        legend_title=date_formats.get(exp, "All Expirations"),
+    )
+
+
+def spec_digest(spec):
+    # fingerprint of what a chart shows but the fields carrying the time of
+    # the snapshot (title, when), which move even when the chart does not
+    digest = blake2b(digest_size=16)
+    feed(digest, spec._replace(title="", when=""))
+    return digest.hexdigest()
+
+
+def feed(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (tuple, list)):
+        digest.update(b"(")
+        for item in value:
+            feed(digest, item)
+        digest.update(b")")
+    elif isinstance(value, dict):
+        feed(digest, tuple(value.items()))
+    else:
+        digest.update(repr(value).encode())
+
+
+# kwargs that carry data rather than style, they can change between snapshots
+DATA_KWARGS = {"label", "x", "y"}
+
+
+def layout(spec):
+    # everything about a chart but its data: a template drawn for one spec
+    # can take the data of another spec with the same layout
+    return (
+        spec.xtz,
+        bool(spec.xticks),
+        spec.spot_line,
+        tuple(
+            (
+                method,
+                tuple(np.shape(arg) for arg in args),
+                tuple((k, v) for k, v in kwargs.items() if k not in DATA_KWARGS),
+            )
+            for method, args, kwargs in spec.artists
+        ),
+    )
+
+
+def update_bar(bars, x, height, width, **kwargs):
+    for rect, left, h in zip(bars, x - width / 2, height):
+        rect.set_x(left)
+        rect.set_height(h)
+    bars.set_label(kwargs.get("label"))
+
+
+def update_plot(lines, x, y, **kwargs):
+    lines[0].set_data(x, y)
+    lines[0].set_label(kwargs.get("label"))
+
+
+def update_axvline(line, x, **kwargs):
+    line.set_xdata([x, x])
+    line.set_label(kwargs.get("label"))
+
+
+def update_axhline(line, y, **kwargs):
+    line.set_ydata([y, y])
+    line.set_label(kwargs.get("label"))
+
+
+def update_axvspan(rect, xmin, xmax, **kwargs):
+    rect.set_x(xmin)
+    rect.set_width(xmax - xmin)
+
+
+def update_axhspan(rect, ymin, ymax, **kwargs):
+    rect.set_y(ymin)
+    rect.set_height(ymax - ymin)
+
+
+# in place updates of what each axes method drew, methods missing here (and
+# collections, which relim ignores) are drawn again
+UPDATES = {
+    "bar": update_bar,
+    "plot": update_plot,
+    "axvline": update_axvline,
+    "axhline": update_axhline,
+    "axvspan": update_axvspan,
+    "axhspan": update_axhspan,
+}
+
+
+def draw_spot_line(ax, spec, label):
+    return ax.axvline(x=spec.spot, color="#707070", linestyle="--", label=label)
+
+
+def spot_label(spec):
+    return f"{spec.ticker} Spot: {spec.spot:,.2f}"
+
+
+class ChartTemplate:
+    # a drawn figure kept between snapshots, later specs only move its
+    # artists and relabel it instead of building the figure again
+    def __init__(self, spec):
+        self.layout = layout(spec)
+        self.fig = Figure(figsize=(10, 6))
+        self.ax = self.fig.add_subplot()
+        self.ax.grid(True)
+        if spec.xtz:
+            self.ax.xaxis.axis_date(ZoneInfo(spec.xtz))
+        self.artists = [
+            getattr(self.ax, method)(*args, **kwargs)
+            for method, args, kwargs in spec.artists
+        ]
+        self.spot = None
+        if spec.spot_line:
+            self.spot = draw_spot_line(self.ax, spec, spot_label(spec))
+        self.label(spec)
+
+    def update(self, spec):
+        redraw = []
+        for i, (method, args, kwargs) in enumerate(spec.artists):
+            if method in UPDATES:
+                UPDATES[method](self.artists[i], *args, **kwargs)
+            else:
+                self.artists[i].remove()
+                redraw.append(i)
+        if self.spot is not None:
+            update_axvline(self.spot, spec.spot, label=spot_label(spec))
+        self.relim(spec)
+        for i in redraw:
+            method, args, kwargs = spec.artists[i]
+            self.artists[i] = getattr(self.ax, method)(*args, **kwargs)
+        self.ax.autoscale_view(scalex=False)
+        self.label(spec)
+
+    def relim(self, spec):
+        # what Axes.relim finds for the y axis, without going through the
+        # bars one patch at a time. The x limits are always set by the spec
+        ax = self.ax
+        ax.dataLim.set_points(Bbox.null().get_points())
+        ax.ignore_existing_data_limits = True
+        for method, args, kwargs in spec.artists:
+            if method == "bar":
+                ys = (0, *args[1])
+            elif method == "plot":
+                ys = args[1]
+            elif method == "axhspan":
+                ys = args
+            elif method == "axhline":
+                ys = (kwargs["y"],)
+            else:  # x only, or a collection drawn again after this
+                continue
+            ys = np.asarray(ys, dtype=float)
+            ax.update_datalim(np.column_stack([np.zeros_like(ys), ys]), updatex=False)
+
+    def label(self, spec):
+        ax = self.ax
+        ax.set_title(spec.title)
+        ax.set_xlim(*spec.xlim)
+        if spec.xticks:
+            ax.set_xticks(*spec.xticks)
+        ax.set_xlabel(spec.xlabel)
+        ax.set_ylabel(spec.ylabel)
+        ax.legend(title=spec.legend_title)
+
+    def png(self):
+        buffer = BytesIO()
+        self.fig.savefig(buffer, format="png", bbox_inches="tight")
+        return buffer.getvalue()
+
+
+# templates of the render worker, by chart
+_templates = LRUCache(maxsize=TEMPLATE_CACHE_SIZE)
+
+
+def render_chart(spec):
+    # png bytes of the chart, runs in a render worker with no pyplot state
+    key = spec[:4]  # ticker, exp, greek, value
+    template = _templates.get(key)
+    if template is not None and template.layout == layout(spec):
+        template.update(spec)
+    else:
+        template = _templates[key] = ChartTemplate(spec)
+    return template.png()
+
+
+MONTAGE_PANEL = (6, 3.6)  # inches per chart of a montage
+
+
+def render_montage(specs):
+    # png bytes of one figure with the charts of a (ticker, exp) view, a row
+    # per greek. Strike charts share their x axis, as do date charts, and
+    # the ticker, time and spot are given once for the whole figure
+    rows = [
+        [spec for spec in specs if spec.greek == greek]
+        for greek in dict.fromkeys(spec.greek for spec in specs)
+    ]
+    cols = max(len(row) for row in rows)
+    fig = Figure(
+        figsize=(MONTAGE_PANEL[0] * cols, MONTAGE_PANEL[1] * len(rows)),
+        layout="constrained",
+    )
+    shared = {}  # first axes of each kind of x axis
+    spot = None
+    for i, row in enumerate(rows):
+        for j, spec in enumerate(row):
+            ax = fig.add_subplot(
+                len(rows), cols, i * cols + j + 1, sharex=shared.get(spec.xlabel)
+            )
+            shared.setdefault(spec.xlabel, ax)
+            ax.grid(True)
+            if spec.xtz:
+                ax.xaxis.axis_date(ZoneInfo(spec.xtz))
+                # dates are too long for a panel's width side by side
+                ax.tick_params(axis="x", labelrotation=30)
+            for method, args, kwargs in spec.artists:
+                getattr(ax, method)(*args, **kwargs)
+            if spec.spot_line:
+                spot = draw_spot_line(ax, spec, "_nolegend_")
+            ax.set_title(spec.value)
+            ax.set_xlim(*spec.xlim)
+            if spec.xticks:
+                ax.set_xticks(*spec.xticks)
+            ax.set_xlabel(spec.xlabel)
+            ax.set_ylabel(spec.ylabel, fontsize="small")
+            ax.legend(title=spec.legend_title, fontsize="small")
+    spec = specs[0]
+    fig.suptitle(f"{spec.ticker} {spec.when} for {spec.exp}")
+    if spot is not None:
+        fig.legend([spot], [spot_label(spec)], loc="outside upper right")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+_render_workers = []
+_render_routes = {}  # worker index of each chart key
+_render_pool_lock = Lock()
+
+
+def get_render_pool(key):
+    # render worker for a chart key, e.g. spec[:4]. The same key always goes
+    # to the same worker, so a template is kept by one worker instead of all
+    # of them. The bot runs threads (discord, scheduler, numba) that a forked
+    # worker would inherit mid-flight, so workers are forked from a fresh
+    # server process instead, which imports the main module and the renderer
+    # once
+    with _render_pool_lock:
+        if not _render_workers:
+            if "forkserver" in get_all_start_methods():
+                context = get_context("forkserver")
+                context.set_forkserver_preload(["__main__", __name__])
+            else:
+                context = get_context("spawn")
+            _render_workers.extend(
+                ProcessPoolExecutor(1, mp_context=context)
+                for _ in range(RENDER_WORKERS)
+            )
+        # new keys are dealt out in turn, which spreads them evenly
+        index = _render_routes.setdefault(key, len(_render_routes) % RENDER_WORKERS)
+    return _render_workers[index]
@@ -0,0 +1,61 @@
+import asyncio
+from itertools import count
+from os import environ
+from time import monotonic
+from modules.metrics import observe
+
+# plot jobs run on the bot's loop through one priority queue: a request for
+# a job already queued or running joins it instead of doing the work again,
+# and interactive commands go ahead of the scheduled sweep
+INTERACTIVE, SWEEP = 0, 1  # priorities, lower runs first
+JOB_WORKERS = int(environ.get("JOB_WORKERS") or 4)  # jobs running at once
+
+
+class Job:
+    def __init__(self, start, priority):
+        self.start = start  # coroutine function doing the work
+        self.priority = priority
+        self.queued = monotonic()
+        self.started = False
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class JobCoordinator:
+    def __init__(self, workers=JOB_WORKERS):
+        self.jobs = {}  # queued and running jobs, by key
+        self.queue = asyncio.PriorityQueue()
+        self.order = count()  # first come first served within a priority
+        self.workers = workers
+        self.tasks = []
+
+    def submit(self, key, priority, start):
+        # awaitable result of the job for key, start() only runs when no job
+        # for key is queued or running already
+        job = self.jobs.get(key)
+        if job is None:
+            job = self.jobs[key] = Job(start, priority)
+            self.queue.put_nowait((priority, next(self.order), key))
+        elif priority < job.priority and not job.started:
+            # queued again ahead, the entry left behind is skipped
+            job.priority = priority
+            self.queue.put_nowait((priority, next(self.order), key))
+        if not self.tasks:
+            self.tasks = [
+                asyncio.ensure_future(self.work()) for _ in range(self.workers)
+            ]
+        return asyncio.shield(job.future)
+
+    async def work(self):
+        while True:
+            priority, _, key = await self.queue.get()
+            job = self.jobs.get(key)
+            if job is None or job.started or job.priority != priority:
+                continue
+            job.started = True
+            observe(f"job_wait_seconds[{priority}]", monotonic() - job.queued)
+            try:
+                job.future.set_result(await job.start())
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                del self.jobs[key]
@@ -0,0 +1,46 @@
+import asyncio
+from threading import Lock
+
+# in-process metrics: a running summary per name, read with snapshot() and
+# served by the webserver under /metrics
+_metrics = {}
+_metrics_lock = Lock()
+_watched_loops = set()
+
+LOOP_LAG_INTERVAL = 0.5  # seconds between event loop lag samples
+
+
+def observe(name, value):
+    with _metrics_lock:
+        metric = _metrics.setdefault(
+            name, {"count": 0, "total": 0.0, "max": value, "last": value}
+        )
+        metric["count"] += 1
+        metric["total"] += value
+        metric["max"] = max(metric["max"], value)
+        metric["last"] = value
+
+
+def snapshot():
+    with _metrics_lock:
+        return {
+            name: dict(metric, mean=metric["total"] / metric["count"])
+            for name, metric in _metrics.items()
+        }
+
+
+async def watch_loop_lag(name="loop_lag_seconds"):
+    # how late the loop wakes a sleeping task: anything blocking the loop
+    # shows up here, along with the heartbeats and commands it delays
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        observe(name, loop.time() - start - LOOP_LAG_INTERVAL)
+
+
+def start_loop_lag_monitor(loop):
+    # once per loop, on_ready runs again on every reconnect
+    if loop not in _watched_loops:
+        _watched_loops.add(loop)
+        loop.create_task(watch_loop_lag())
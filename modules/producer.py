@@ -0,0 +1,274 @@
+import orjson
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from os import environ, getcwd, replace
+from pathlib import Path
+from threading import Lock
+from zoneinfo import ZoneInfo
+from modules.chain import temp_path
+from modules.ticker_dwn import dwn_data, read_meta, REFRESH_DEADLINE
+
+try:  # non-blocking exclusive lock, raises OSError while another process has it
+    from fcntl import flock, LOCK_EX, LOCK_NB
+
+    def try_lock(f):
+        flock(f, LOCK_EX | LOCK_NB)
+
+except ImportError:  # windows
+    from msvcrt import locking, LK_NBLCK
+
+    def try_lock(f):
+        f.seek(0)
+        locking(f.fileno(), LK_NBLCK, 1)
+
+# one producer per process owns downloading: every refresh publishes the
+# snapshot versions to a manifest and notifies the subscribed consumers
+# (Dash app, scheduled poster, bot commands) instead of each of them
+# downloading on its own schedule. A snapshot is downloaded once, and its
+# profile buckets are computed by the first process that reads it and saved
+# for the others (calc.shared_profile_buckets). Every process still reads
+# the chain itself from the memory mapped binary copy and computes the
+# exposures of each option at spot, which are cheap next to the buckets
+REFRESH_CRONTAB = environ.get("REFRESH_CRONTAB") or "*/5 8-17 * * 0-4"
+MANIFEST_POLL = float(environ.get("MANIFEST_POLL") or 5)  # seconds
+WARM_WORKERS = int(environ.get("WARM_WORKERS") or 4)  # threads warming views
+
+
+def ticker_key(ticker):
+    # ^SPX, _SPX and spx all name the spx snapshot
+    return ticker.lstrip("^_").lower()
+
+
+def manifest_path():
+    return Path(f"{getcwd()}/data/manifest.json")
+
+
+class LockedRole:
+    # a role held by one process at a time through a lock file in data/. The
+    # os releases the lock when its holder exits, so another process asking
+    # for the role then takes it over
+    def __init__(self, name):
+        self.name = name
+        self._file = None
+        self._lock = Lock()
+
+    def take(self):
+        # whether this process holds the role, trying to take it if not
+        with self._lock:
+            if self._file is None:
+                lock_file = open(f"{getcwd()}/data/{self.name}.lock", "a+b")
+                try:
+                    try_lock(lock_file)
+                except OSError:
+                    lock_file.close()
+                    return False
+                self._file = lock_file
+            return True
+
+    @property
+    def held(self):
+        return self._file is not None
+
+
+def read_manifest():
+    try:
+        with open(manifest_path(), "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {"versions": {}, "published": None}
+
+
+class Producer:
+    def __init__(self, is_json=True):
+        self.is_json = is_json
+        self.subscribers = []
+        self.warmers = []
+        self.versions = read_manifest()["versions"]
+        self.ready = {}
+        self.electable = False
+        self._flights = {}
+        self._lock = Lock()
+        self._role = LockedRole("producer")
+        self._sched = None
+        self._warm_pool = None
+
+    def subscribe(self, callback):
+        # callback(changed) runs after every refresh, changed lists the
+        # tickers with a new snapshot and is empty when nothing moved
+        self.subscribers.append(callback)
+        return callback
+
+    def version(self, ticker):
+        return self.versions.get(ticker_key(ticker))
+
+    def warm(self, views):
+        # decorator: warm_view(ticker, expir, version) fills a consumer's cache
+        # for each of views, a list of (ticker, expir). It runs in a worker
+        # pool when the process starts and whenever the ticker gets a new
+        # snapshot, so chart requests only read what is already computed
+        def register(warm_view):
+            self.warmers.append((warm_view, views))
+            return warm_view
+
+        return register
+
+    def is_ready(self, ticker, expir):
+        # whether the view was warmed for the current snapshot, a read of one
+        # that was not computes it on the request
+        return self.ready.get((ticker_key(ticker), expir)) == self.version(ticker)
+
+    def start_warming(self, changed=None):
+        if self._warm_pool is None:
+            self._warm_pool = ThreadPoolExecutor(WARM_WORKERS, "warm")
+        for warm_view, views in self.warmers:
+            for ticker, expir in views:
+                if changed is None or ticker_key(ticker) in changed:
+                    self._warm_pool.submit(self.warm_view, warm_view, ticker, expir)
+
+    def warm_view(self, warm_view, ticker, expir):
+        version = self.version(ticker)
+        try:
+            warm_view(ticker, expir, version)
+        except Exception as e:
+            print(f"warming {ticker}/{expir} failed: {e}")
+        else:
+            self.ready[(ticker_key(ticker), expir)] = version
+
+    def refresh(self, select=None):
+        # single flight: callers that ask for the same refresh while it
+        # runs wait for it and share its result
+        if self._sched is not None and not self.leader:
+            print("following the producer process, not downloading")
+            return []
+        key = tuple(select or ())
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            return flight.result()
+        try:
+            changed = dwn_data(
+                select,
+                is_json=self.is_json,
+                deadline=REFRESH_DEADLINE,  # late downloads publish when they land
+                on_change=self.publish,
+            )
+            self.publish(changed)
+            flight.set_result(changed)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+        return changed
+
+    def publish(self, changed):
+        changed = [ticker_key(ticker) for ticker in changed]
+        if changed:
+            d_format = "json" if self.is_json else "csv"
+            with self._lock:
+                for ticker in changed:
+                    path = Path(f"{getcwd()}/data/{d_format}/{ticker}_quotedata")
+                    meta = read_meta(path.with_suffix(f".{d_format}"))
+                    self.versions[ticker] = meta["version"] if meta else None
+                write_manifest(self.versions)
+        self.notify(changed)
+
+    def notify(self, changed):
+        if changed:
+            self.start_warming(changed)
+        for callback in self.subscribers:
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"subscriber {callback.__name__} failed: {e}")
+
+    def run(self):
+        # of all the processes sharing data/ (gunicorn workers, the bot) the
+        # one holding the lock file downloads and the others follow it.
+        # DATA_PRODUCER=0 keeps a process a follower
+        self.electable = (environ.get("DATA_PRODUCER") or "1").strip() != "0"
+        if self.electable and self.elect():
+            self.start()
+        else:
+            self.follow()
+        self.start_warming()
+        return self
+
+    def elect(self):
+        # a follower takes over on its next poll once the leader exits
+        return self._role.take()
+
+    @property
+    def leader(self):
+        return self._role.held
+
+    def scheduler(self):
+        if self._sched is None:
+            self._sched = BackgroundScheduler(daemon=True)
+            self._sched.start()
+        return self._sched
+
+    def start(self):
+        # refresh on the market hours schedule
+        self.scheduler().add_job(
+            self.refresh,
+            CronTrigger.from_crontab(
+                REFRESH_CRONTAB, timezone=ZoneInfo("America/New_York")
+            ),
+            id="refresh",
+            max_instances=1,
+            coalesce=True,
+        )
+        print(f"Producer started: refreshing on '{REFRESH_CRONTAB}'")
+
+    def follow(self):
+        # pick up the versions the leader publishes to the manifest and
+        # notify the local subscribers
+        self.scheduler().add_job(
+            self.poll_manifest, "interval", seconds=MANIFEST_POLL, id="follow"
+        )
+
+    def poll_manifest(self):
+        if self.electable and self.elect():
+            self._sched.remove_job("follow")
+            self.start()
+        versions = read_manifest()["versions"]
+        with self._lock:
+            changed = [t for t, v in versions.items() if self.versions.get(t) != v]
+            self.versions.update(versions)
+        if changed:
+            self.notify(changed)
+
+
+def write_manifest(versions):
+    path = manifest_path()
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(
+                orjson.dumps(
+                    {"versions": versions, "published": datetime.now().isoformat()}
+                )
+            )
+        replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+_producer = None
+_producer_lock = Lock()
+
+
+def get_producer():
+    # the process wide producer
+    global _producer
+    with _producer_lock:
+        if _producer is None:
+            _producer = Producer()
+    return _producer
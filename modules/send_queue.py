@@ -0,0 +1,124 @@
+import asyncio
+import discord
+from io import BytesIO
+from os import environ
+from random import random
+from time import perf_counter
+from typing import NamedTuple
+from modules.metrics import observe
+
+# charts are queued per channel and posted together: one message carries the
+# captions and up to 10 images, instead of a message and an upload per chart.
+# discord.py already waits out the rate limit buckets of each route, the
+# queue adds backpressure on top and retries what it gives up on
+MAX_ATTACHMENTS = 10  # Discord's limit per message
+MAX_MESSAGE_BYTES = int(environ.get("MAX_MESSAGE_BYTES") or 8 * 2**20)
+SEND_QUEUE_SIZE = int(environ.get("SEND_QUEUE_SIZE") or 50)  # charts per channel
+SEND_LINGER = float(environ.get("SEND_LINGER") or 1)  # seconds to fill a message
+SEND_RETRIES = 3
+MAX_CAPTION = 2000  # characters of a message
+
+
+class Upload(NamedTuple):
+    caption: str
+    png: bytes
+    filename: str
+    sent: asyncio.Future  # a Posted once posted, None when given up
+
+
+class Posted(NamedTuple):
+    message_url: str
+    attachment_url: str  # Discord CDN link of the image
+
+
+class ChannelQueue:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name  # for logs and metrics
+        self.queue = asyncio.Queue(SEND_QUEUE_SIZE)
+        self.task = asyncio.ensure_future(self.run())
+
+    async def put(self, caption, png, filename):
+        # waits while the channel is SEND_QUEUE_SIZE charts behind, returns
+        # a future set to where the chart was posted
+        sent = asyncio.get_running_loop().create_future()
+        await self.queue.put(Upload(caption, png, filename, sent))
+        observe(f"send_queue_depth[{self.name}]", self.queue.qsize())
+        return sent
+
+    async def run(self):
+        held = None  # the upload that did not fit in the last message
+        while True:
+            batch = [held or await self.queue.get()]
+            held = None
+            size = len(batch[0].png)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + SEND_LINGER
+            while len(batch) < MAX_ATTACHMENTS:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        upload = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    upload = self.queue.get_nowait()
+                if size + len(upload.png) > MAX_MESSAGE_BYTES:
+                    held = upload
+                    break
+                batch.append(upload)
+                size += len(upload.png)
+            observe(f"send_queue_depth[{self.name}]", self.queue.qsize())
+            message = await self.send(batch)
+            for i, upload in enumerate(batch):
+                posted = None
+                if message is not None:
+                    posted = Posted(message.jump_url, message.attachments[i].url)
+                if not upload.sent.done():
+                    upload.sent.set_result(posted)
+
+    async def send(self, batch):
+        caption = "\n".join(dict.fromkeys(upload.caption for upload in batch))
+        started = perf_counter()
+        for attempt in range(SEND_RETRIES + 1):
+            files = [
+                discord.File(BytesIO(upload.png), filename=upload.filename)
+                for upload in batch
+            ]
+            try:
+                message = await self.channel.send(caption[:MAX_CAPTION], files=files)
+            except discord.RateLimited as e:
+                wait = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"Failed to send to {self.name}: {e.status} - {e.text}")
+                    return None
+                wait = min(8.0, 0.5 * 2**attempt) * random()
+                if e.status == 429:
+                    wait = float(e.response.headers.get("Retry-After") or wait)
+            except Exception as e:
+                print(f"Failed to send to {self.name}: {type(e).__name__} - {e}")
+                return None
+            else:
+                elapsed = perf_counter() - started
+                observe(f"send_charts_per_second[{self.name}]", len(batch) / elapsed)
+                print(f"Sent {len(batch)} charts to Discord channel {self.name}")
+                return message
+            observe(f"send_retries[{self.name}]", wait)
+            print(f"Sending to {self.name} throttled, retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+        print(f"Giving up sending {len(batch)} charts to {self.name}")
+        return None
+
+
+_queues = {}
+
+
+def get_channel_queue(channel, name):
+    # one queue and sender task per channel, on the bot's loop
+    queue = _queues.get(channel.id)
+    if queue is None or queue.task.done():
+        queue = _queues[channel.id] = ChannelQueue(channel, name)
+    return queue
@@ -1,8 +1,8 @@
 import numpy as np
 import ctypes
 from math import tau
-from numba import vectorize, njit
-from numba.types import float64, UniTuple, string
+from numba import vectorize, njit, prange
+from numba.types import float64, int64, boolean, UniTuple, string
 from numba.extending import get_cython_function_address
 
 
@@ -51,29 +51,6 @@ def calc_dp_cdf_pdf(S, K, vol, T, r, q):
 # Black-Scholes Pricing Formula
 
 
-@njit(
-    float64[:, :](float64[:, :], float64[:], float64, string, float64[:], float64[:, :])
-)
-def calc_delta_ex(S, T, q, opt_type, OI, cdf_dp):
-    if opt_type == "call":
-        delta = np.exp(-q * T) * cdf_dp
-    else:
-        delta = -np.exp(-q * T) * (1 - cdf_dp)
-    # change in option price per one percent move in underlying
-    return delta * OI * S
-
-
-@njit(
-    float64[:, :](
-        float64[:, :], float64[:], float64[:], float64, float64[:], float64[:, :]
-    )
-)
-def calc_gamma_ex(S, vol, T, q, OI, pdf_dp):
-    gamma = np.exp(-q * T) * pdf_dp / (S * vol * np.sqrt(T))
-    # change in delta per one percent move in underlying
-    return gamma * OI * S * S  # Gamma is same formula for calls and puts
-
-
 @njit(
     float64[:, :](
         float64[:, :],
@@ -119,3 +96,81 @@ def calc_charm_ex(S, vol, T, r, q, opt_type, OI, dp, cdf_dp, pdf_dp):
         ) / (2 * T * vol * np.sqrt(T))
     # change in delta per day until expiration
     return charm * OI * S * T
+
+
+# Net exposure profiles over a grid of spot levels S, fused in a single pass
+# and split into buckets (one per expiration) so any set of expirations can be
+# summed from the result. K, vol, T and OI describe option legs (calls and
+# puts stacked together), is_call selects the leg type and bucket its row in
+# the output. Puts are signed so the outputs are the net totals: delta is
+# call + put, gamma/vanna/charm are call - put.
+# Levels are independent, so the same body is compiled serial and parallel
+# (prange runs as a plain range when parallel is off).
+def exposure_buckets(S, K, vol, T, OI, is_call, bucket, n_buckets, r, q):
+    n_levels = S.shape[0]
+    delta_ex = np.zeros((n_buckets, n_levels))
+    gamma_ex = np.zeros((n_buckets, n_levels))
+    vanna_ex = np.zeros((n_buckets, n_levels))
+    charm_ex = np.zeros((n_buckets, n_levels))
+    # terms that only depend on the option leg, not the spot level
+    sqrt_T = np.sqrt(T)
+    vol_sqrt_T = vol * sqrt_T
+    exp_qT = np.exp(-q * T)
+    drift = (r - q + 0.5 * vol**2) * T
+    sqrt_two = np.sqrt(2.0)
+    sqrt_tau = np.sqrt(tau)
+    for i in prange(n_levels):
+        s = S[i]
+        for j in range(K.shape[0]):
+            b = bucket[j]
+            dp = (np.log(s / K[j]) + drift[j]) / vol_sqrt_T[j]
+            dm = dp - vol_sqrt_T[j]
+            cdf_dp = 0.5 * (1.0 + erf_fn(dp / sqrt_two))
+            pdf_dp = np.exp(dp**2.0 / -2.0) / sqrt_tau
+            weight = OI[j] * s
+            charm_decay = (
+                exp_qT[j]
+                * pdf_dp
+                * (2 * (r - q) * T[j] - dm * vol_sqrt_T[j])
+                / (2 * T[j] * vol_sqrt_T[j])
+            )
+            gamma = exp_qT[j] * pdf_dp / (s * vol_sqrt_T[j]) * weight * s
+            vanna = -exp_qT[j] * pdf_dp * (dm / vol[j]) * weight * vol[j]
+            # delta: change in option price per one percent move in underlying
+            # gamma: change in delta per one percent move in underlying
+            # vanna: change in delta per one percent move in IV
+            # charm: change in delta per day until expiration
+            if is_call[j]:
+                delta_ex[b, i] += exp_qT[j] * cdf_dp * weight
+                gamma_ex[b, i] += gamma
+                vanna_ex[b, i] += vanna
+                charm_ex[b, i] += (
+                    (q * exp_qT[j] * cdf_dp - charm_decay) * weight * T[j]
+                )
+            else:
+                delta_ex[b, i] -= exp_qT[j] * (1 - cdf_dp) * weight
+                gamma_ex[b, i] -= gamma
+                vanna_ex[b, i] -= vanna
+                charm_ex[b, i] -= (
+                    (-q * exp_qT[j] * (1 - cdf_dp) - charm_decay) * weight * T[j]
+                )
+    return delta_ex, gamma_ex, vanna_ex, charm_ex
+
+
+exposure_buckets_sig = UniTuple(float64[:, :], 4)(
+    float64[:],
+    float64[:],
+    float64[:],
+    float64[:],
+    float64[:],
+    boolean[:],
+    int64[:],
+    int64,
+    float64,
+    float64,
+)
+# nogil so snapshots of different tickers can be built on parallel threads
+calc_exposure_buckets = njit(exposure_buckets_sig, nogil=True)(exposure_buckets)
+calc_exposure_buckets_parallel = njit(exposure_buckets_sig, parallel=True)(
+    exposure_buckets
+)
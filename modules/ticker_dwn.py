@@ -1,14 +1,137 @@
-import requests
+import aiohttp
+import aiofiles
+import asyncio
+import atexit
 import base64
 import orjson
-from multiprocessing.dummy import Pool as ThreadPool
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from os import environ, getcwd
+from hashlib import sha256
+from os import environ, getcwd, replace
 from pathlib import Path
-from functools import partial
+from random import random
+from time import monotonic
+from threading import Lock, Thread
+from modules.chain import temp_path, write_binary_snapshot
 
+try:  # aiohttp only decodes brotli responses when a brotli package is installed
+    import brotli  # noqa: F401
 
-def fulfill_req(ticker, is_json, session):
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+CHUNK_SIZE = 1 << 16  # bytes written per chunk of a streamed response
+
+# every attempt has a deadline, failed attempts are retried with exponential
+# backoff and full jitter, and a ticker that keeps failing is left alone for
+# a cooldown instead of being hammered on every refresh
+REQUEST_TIMEOUT = float(environ.get("REQUEST_TIMEOUT") or 30)  # seconds
+REQUEST_RETRIES = int(environ.get("REQUEST_RETRIES") or 3)
+BACKOFF_BASE, BACKOFF_CAP = 0.5, 8.0  # seconds
+BREAKER_THRESHOLD = 3  # consecutive failed refreshes that open the breaker
+BREAKER_COOLDOWN = float(environ.get("BREAKER_COOLDOWN") or 300)  # seconds
+# how long callers wait for a refresh before serving the last snapshot
+REFRESH_DEADLINE = float(environ.get("REFRESH_DEADLINE") or 20)  # seconds
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# downloads run on one long-lived event loop with one session, so the
+# connection pool and its keep-alive connections outlive each refresh
+_loop = None
+_session = None
+_loop_lock = Lock()
+# refreshes in flight, so overlapping callers share one download per ticker
+_refreshes = {}
+
+
+def get_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            Thread(target=_loop.run_forever, name="downloader", daemon=True).start()
+    return _loop
+
+
+async def get_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=8, keepalive_timeout=360),
+            headers={"Accept-Encoding": ACCEPT_ENCODING},
+            timeout=aiohttp.ClientTimeout(
+                total=REQUEST_TIMEOUT, sock_connect=REQUEST_TIMEOUT / 3
+            ),
+        )
+    return _session
+
+
+@atexit.register
+def close_session():
+    if _session is not None and not _session.closed:
+        asyncio.run_coroutine_threadsafe(_session.close(), _loop).result(timeout=5)
+
+
+class RetryableError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # opens after consecutive failures, then lets one refresh through per
+    # cooldown until a success closes it again
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def allow(self):
+        return monotonic() >= self.open_until
+
+    def record(self, ok):
+        self.failures = 0 if ok else self.failures + 1
+        if self.failures >= BREAKER_THRESHOLD:
+            self.open_until = monotonic() + BREAKER_COOLDOWN
+
+
+breakers = {}
+
+
+async def refresh(ticker, is_json, session):
+    breaker = breakers.setdefault((ticker, is_json), CircuitBreaker())
+    if not breaker.allow():
+        print("circuit open, serving last snapshot for", ticker)
+        return False
+    for attempt in range(REQUEST_RETRIES + 1):
+        try:
+            changed = await fulfill_req(ticker, is_json, session)
+        except (
+            RetryableError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,  # body cut short
+            asyncio.TimeoutError,
+        ) as e:
+            print(f"attempt {attempt + 1} failed for {ticker}: {type(e).__name__} {e}")
+            if attempt < REQUEST_RETRIES:
+                backoff = min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)
+                await asyncio.sleep(random() * backoff)
+        except aiohttp.ClientResponseError as e:
+            # not worth retrying now, but a ticker that keeps failing this
+            # way still opens the breaker
+            print(e, "- keeping last snapshot for", ticker)
+            breaker.record(ok=False)
+            return False
+        except Exception:
+            breaker.record(ok=False)
+            raise
+        else:
+            breaker.record(ok=True)
+            return changed
+    breaker.record(ok=False)
+    print("giving up, serving last snapshot for", ticker)
+    return False
+
+
+async def fulfill_req(ticker, is_json, session):
     api_url = (
         environ.get("API_URL")
         or f"https://cdn.cboe.com/api/global/delayed_quotes/options/{ticker.upper()}.json"
@@ -20,52 +143,172 @@ def fulfill_req(ticker, is_json, session):
         if is_json
         else Path(f"{getcwd()}/data/csv/{ticker}_quotedata.csv")
     )
-    with open(filename, "wb") as f, session.get(api_url) as r:
-        for _ in range(3):  # in case of unavailable data, retry twice
-            try:  # check if data is available
-                r.raise_for_status()
-            except requests.exceptions.HTTPError as e:
-                print(e)
-                f.write("Unavailable".encode("utf-8"))
-                if r.status_code == 504:  # check if timeout occurred
-                    print("gateway timeout, retrying search for", ticker, d_format)
-                    continue
-                elif r.status_code == 500:  # internal server error
-                    print(
-                        "internal server error, retrying search for", ticker, d_format
-                    )
-                    continue
-            else:
+    bin_filename = Path(f"{getcwd()}/data/bin/{ticker}_quotedata.bin")
+
+    headers = {"Accept": "application/json" if is_json else "text/csv"}
+    stored = read_meta(filename) if filename.exists() else None
+    if stored:  # revalidate the stored snapshot
+        if stored.get("etag"):
+            headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            headers["If-Modified-Since"] = stored["last_modified"]
+
+    # the download goes to a temporary file and only replaces the published
+    # snapshot once complete, so readers never see a partial file and a
+    # failed download keeps the last good snapshot
+    tmp_filename = temp_path(filename)
+    try:
+        async with session.get(api_url, headers=headers) as r:
+            if r.status == 304:
+                print("\nno new data for", ticker, d_format)
+                return False
+            if r.status in RETRY_STATUSES:
+                raise RetryableError(f"{r.status} {r.reason}")
+            r.raise_for_status()  # check if data is available
+            digest = sha256()
+            async with aiofiles.open(tmp_filename, "wb") as f:
                 if is_json:
-                    # incoming json data
-                    f.write(orjson.dumps(r.json()))
+                    # incoming json data, written to disk as it arrives
+                    size = 0
+                    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                        digest.update(chunk)
+                        size += await f.write(chunk)
+                    if not has_expected_length(r, size):
+                        raise RetryableError("incomplete response")
                 else:
                     # incoming csv data
-                    for line in r.iter_lines():
+                    async for line in r.content:
+                        line = line.rstrip(b"\r\n")
                         if len(line) % 4:
                             # add padding:
                             line += b"==="
-                        f.write(base64.b64decode(line) + "\n".encode("utf-8"))
-                print("\nrequest done for", ticker, d_format)
-                break
+                        line = base64.b64decode(line) + "\n".encode("utf-8")
+                        digest.update(line)
+                        await f.write(line)
+            version = digest.hexdigest()[:16]
+            validators = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+
+        if stored and stored.get("version") == version:
+            # a server without validators sent the same snapshot again. The
+            # published files stay untouched, so readers keep their cached
+            # snapshots keyed by modification time
+            write_meta(filename, {**stored, **validators})
+            print("\nno new data for", ticker, d_format)
+            return False
+        if is_json:
+            await asyncio.get_running_loop().run_in_executor(
+                None, publish_json, tmp_filename, filename, bin_filename
+            )
+        else:
+            replace(tmp_filename, filename)
+        write_meta(
+            filename,
+            {"version": version, **validators, "published": datetime.now().isoformat()},
+        )
+    finally:
+        tmp_filename.unlink(missing_ok=True)
+    print("\nrequest done for", ticker, d_format)
+    return True
+
+
+def publish_json(tmp_filename, filename, bin_filename):
+    # the payload has to decode into a paired option chain, written out as
+    # the columnar copy readers memory map, before either file replaces the
+    # last good snapshot. Readers may have the old copy mapped, so it is
+    # written aside too, and swapped in after the json so it is the newer
+    tmp_bin_filename = temp_path(bin_filename)
+    try:
+        with open(tmp_filename, "rb") as f:
+            write_binary_snapshot(tmp_bin_filename, orjson.loads(f.read()))
+        replace(tmp_filename, filename)
+        replace(tmp_bin_filename, bin_filename)
+    finally:
+        tmp_bin_filename.unlink(missing_ok=True)
+
+
+def meta_path(filename):
+    return filename.with_name(f"{filename.stem}.meta.json")
+
+
+def read_meta(filename):
+    # version and http validators of the published snapshot, if any
+    try:
+        with open(meta_path(filename), "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def write_meta(filename, meta):
+    path = meta_path(filename)
+    tmp_path = temp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(meta))
+        replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
 
+def has_expected_length(r, size):
+    # Content-Length only matches the bytes read when the body is not encoded
+    expected = r.headers.get("Content-Length")
+    if expected is None or r.headers.get("Content-Encoding"):
+        return True
+    return int(expected) == size
 
-def dwn_data(select, is_json):
-    pool = ThreadPool()
+
+async def dwn_data_async(tickers, is_json):
+    session = await get_session()
+    tickers_format = [
+        f"_{ticker[1:]}" if ticker[0] == "^" else ticker for ticker in tickers
+    ]
+    results = await asyncio.gather(
+        *(shared_refresh(ticker, is_json, session) for ticker in tickers_format),
+        return_exceptions=True,
+    )
+    for ticker, result in zip(tickers, results):
+        if isinstance(result, Exception):
+            print(f"download failed for {ticker}: {type(result).__name__} - {result}")
+    return [ticker for ticker, result in zip(tickers, results) if result is True]
+
+
+def shared_refresh(ticker, is_json, session):
+    # join the refresh of this ticker already in flight, if any
+    key = (ticker, is_json)
+    if key not in _refreshes:
+        task = asyncio.ensure_future(refresh(ticker, is_json, session))
+        task.add_done_callback(lambda _: _refreshes.pop(key, None))
+        _refreshes[key] = task
+    return asyncio.shield(_refreshes[key])
+
+
+def dwn_data(select, is_json, deadline=None, on_change=None):
+    # download the selected tickers, returns the ones that have new data.
+    # With a deadline, a slow refresh keeps running in the background while
+    # the caller goes on with the last snapshot; on_change then gets the
+    # tickers it changed once it is done
     print(f"\ndownload start: {datetime.now()}\n")
     tickers_pool = (environ.get("TICKERS") or "^SPX,^NDX,^RUT").strip().split(",")
     if select:  # select tickers to download
         tickers_pool = [f"^{t}" if f"^{t}" in tickers_pool else t for t in select]
-    tickers_format = [
-        f"_{ticker[1:]}" if ticker[0] == "^" else ticker for ticker in tickers_pool
-    ]
-    session = requests.Session()
-    session.headers.update({"Accept": "application/json" if is_json else "text/csv"})
-    fulfill_req_with_args = partial(fulfill_req, is_json=is_json, session=session)
-    pool.map(fulfill_req_with_args, tickers_format)
-    pool.close()
-    pool.join()
+    future = asyncio.run_coroutine_threadsafe(
+        dwn_data_async(tickers_pool, is_json), get_loop()
+    )
+    try:
+        changed = future.result(timeout=deadline)
+    except FutureTimeoutError:
+        print(f"refresh past {deadline}s deadline, serving last snapshot")
+        if on_change:
+            future.add_done_callback(
+                lambda f: f.exception() is None and f.result() and on_change(f.result())
+            )
+        return []
     print(f"\n\ndownload end: {datetime.now()}\n")
+    return changed
 
 
 if __name__ == "__main__":
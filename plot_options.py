@@ -1,24 +1,24 @@
 import pandas as pd
-import numpy as np
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from os import environ, makedirs
 import os
-import shutil
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from apscheduler.triggers import combining, cron
 from modules.calc import get_options_data
-from modules.ticker_dwn import dwn_data
+from modules.producer import get_producer, ticker_key
+from modules.charts import chart_spec, get_render_pool, render_chart, render_montage, spec_digest
+from modules.metrics import observe
+from modules.send_queue import get_channel_queue
+from modules.jobs import INTERACTIVE, SWEEP, JobCoordinator
 from cachetools import TTLCache, cached
 import orjson
-import discord
 import aiofiles
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Condition, Lock
+from time import monotonic, perf_counter
+from typing import NamedTuple
 
 # Load environment variables
 load_dotenv()
@@ -33,7 +33,13 @@ VISUALIZATIONS = {
     "vanna": ["Absolute Vanna Exposure", "Implied Volatility Average", "Vanna Exposure Profile"],
     "charm": ["Absolute Charm Exposure", "Charm Exposure Profile"],
 }
-PLOT_DIR = "plots"
+# charts are rendered in memory, set PLOT_ARCHIVE_DIR to also keep them on disk
+PLOT_ARCHIVE_DIR = environ.get("PLOT_ARCHIVE_DIR")
+ANALYSIS_WORKERS = int(environ.get("ANALYSIS_WORKERS") or 2)  # threads analyzing views
+# PLOT_MONTAGE=1 posts the charts of a ticker/expiration as one image
+PLOT_MONTAGE = (environ.get("PLOT_MONTAGE") or "0").strip() == "1"
+# Discord CDN links expire, $load generates charts posted before this again
+ATTACHMENT_MAX_AGE = float(environ.get("ATTACHMENT_MAX_AGE") or 12 * 3600)  # seconds
 TZ = "America/New_York"  # CEST timezone
 DISCORD_CHANNEL_IDS = {
     "^SPX/0dte/delta": 1387377585427841094,  # Replace with actual channel IDs
@@ -77,17 +83,27 @@ DISCORD_CHANNEL_IDS = {
     "^NDX/all/vanna": 1387378622293344356,
     "^NDX/all/charm": 1387378750827794644,
 }
+# montage channels by ticker/expiration, the delta channel is used otherwise
+DISCORD_MONTAGE_CHANNEL_IDS = {}
 
-# Initialize cache
+# Initialize cache, keyed by snapshot version so a refresh doesn't empty it
 cache = TTLCache(maxsize=150, ttl=60 * 15)  # 15-minute cache
+# one thread computes a missing entry while the others wait for it
+cache_condition = Condition()
+analysis_pool = ThreadPoolExecutor(ANALYSIS_WORKERS, "analysis")
+plot_jobs = JobCoordinator()
 
-# Check and clean plot directory on first run
-try:
-    shutil.rmtree(PLOT_DIR)
-except:
-    pass
+class PostedChart(NamedTuple):
+    digest: str
+    message_url: str
+    attachment_url: str
+    posted_at: float  # monotonic
 
-makedirs(PLOT_DIR, exist_ok=True)
+# last chart posted, by (ticker, exp, greek, visualization)
+posted_charts = {}
+# snapshot version and (key, digest) of the charts of each (ticker, exp, greek)
+# view whose charts are all posted
+posted_views = {}
 
 # Discord client (passed from bot.py)
 discord_client = None
@@ -96,51 +112,44 @@ def set_discord_client(client):
     global discord_client
     discord_client = client
     print(f"Discord client set: {client}")
+    start_plot_cycle()  # post what changed while the bot was connecting
 
-async def send_plot_to_discord(filename, ticker, exp, greek):
+async def send_plot_to_discord(png, filename, ticker, exp, greek):
+    # queues the chart on its channel, returns a future set once it is posted
+    channel_key = f"{ticker}/{exp}/{greek}"
+    return await queue_upload(png, filename, channel_key, DISCORD_CHANNEL_IDS.get(channel_key))
+
+async def send_montage_to_discord(png, filename, ticker, exp):
+    channel_key = f"{ticker}/{exp}"
+    channel_id = DISCORD_MONTAGE_CHANNEL_IDS.get(channel_key) or DISCORD_CHANNEL_IDS.get(f"{channel_key}/delta")
+    return await queue_upload(png, filename, channel_key, channel_id)
+
+async def queue_upload(png, filename, channel_key, channel_id):
     if discord_client is None:
         print("Discord client not initialized")
-        return
-    channel_key = f"{ticker}/{exp}/{greek}"
-    channel_id = DISCORD_CHANNEL_IDS.get(channel_key)
+        return None
     if not channel_id:
         print(f"No Discord channel found for {channel_key}")
-        return
+        return None
     channel = discord_client.get_channel(channel_id)
     if not channel:
         print(f"Channel ID {channel_id} not found")
-        return
-    
-    # Check if the file exists before attempting to send
-    if not os.path.exists(filename):
-        print(f"File not found: {filename}")
-        return
-    
+        return None
+
+    # caption and image go out in one message, with the channel's other charts
+    message = f"{channel_key} at {datetime.now(ZoneInfo('America/New_York')).ctime()} EST"
+    return await get_channel_queue(channel, channel_key).put(message, png, filename)
+
+def archive_plot(png, path):
     try:
-        message = f"{ticker}/{exp}/{greek} at {datetime.now(ZoneInfo("America/New_York")).ctime()} EST"
-        await channel.send(message)
-        print(f"Sent message: {message} to Discord channel {channel_key}")
-        # Let discord.File handle the file opening
-        file = discord.File(filename)
-        await channel.send(file=file)
-        print(f"Sent {filename} to Discord channel {channel_key}")
-    except Exception as e:
-        print(f"Failed to send {filename} to {channel_key}: {type(e).__name__} - {e}")
-
-def cleanup_timestamp_directory(timestamp):
-    for ticker in TICKERS:
-        for exp in EXPIRATIONS:
-            for greek in GREEKS:
-                timestamp_dir = os.path.join(PLOT_DIR, ticker, exp, greek, timestamp)
-                try:
-                    if os.path.exists(timestamp_dir):
-                        shutil.rmtree(timestamp_dir)
-                        print(f"Deleted timestamp directory {timestamp_dir}")
-                except Exception as e:
-                    print(f"Error deleting timestamp directory {timestamp_dir}: {e}")
-
-@cached(cache)
-def analyze_data(ticker, expir):
+        makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(png)
+    except OSError as e:
+        print(f"Error archiving {path}: {e}")
+
+@cached(cache, lock=cache_condition, condition=cache_condition)
+def analyze_data(ticker, expir, version):
     #print(f"Fetching data for {ticker}/{expir}")
     result = get_options_data(
         ticker,
@@ -150,244 +159,209 @@ def analyze_data(ticker, expir):
     )
     return result if result else (None,) * 16
 
-def sensor(select=None):
-    #print(f"Executing sensor() at {datetime.now(ZoneInfo(TZ)).strftime('%Y-%m-%d %H:%M:%S')}")
-    dwn_data(select, is_json=True)
-    cache.clear()
-    #print("sensor() completed")
+producer = get_producer()
+
+def next_trading_day():
+    today = datetime.now(ZoneInfo(TZ)).date()
+    if "Fri" in datetime.now(ZoneInfo("America/New_York")).ctime():
+        return today + timedelta(days=3)
+    return today + timedelta(days=1)
+
+def expiration_param(exp):
+    # 1dte is the next trading day, the other expirations pass through
+    if exp == "1dte":
+        return next_trading_day().strftime("%Y-%m-%d")
+    return exp
+
+@producer.warm([(ticker, exp) for ticker in TICKERS for exp in EXPIRATIONS])
+def warm_view(ticker, exp, version):
+    # precomputed as soon as a snapshot lands, generate_plots then only reads
+    analyze_data(ticker.lower(), expiration_param(exp), version)
+
+def view_specs(ticker, exp, greeks, tomorrow, version):
+    # analysis, chart specs and their digests of one view, run on an analysis
+    # thread
+    if not producer.is_ready(ticker, exp):
+        print(f"cold read of {ticker}/{exp}, not warmed for this snapshot yet")
+    data = analyze_data(ticker.lower(), expiration_param(exp), version)
+    if data[0] is None:
+        #print(f"No data available for {ticker}/{exp}, skipping")
+        return []
+    df = data[0]
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        #print(f"Invalid or empty DataFrame for {ticker}/{exp}, skipping")
+        return []
+
+    specs = []
+    for greek in greeks:
+        for value in VISUALIZATIONS[greek]:
+            #print(f"Processing {ticker}/{exp}/{greek}/{value}")
+            try:
+                spec = chart_spec(ticker, exp, greek, value, data, tomorrow)
+            except Exception as e:
+                print(f"Error processing {ticker}/{exp}/{greek}/{value}: {e}")
+                continue
+            if spec is not None:
+                specs.append((spec, spec_digest(spec)))
+    return specs
 
-async def generate_plots(specific_ticker=None, specific_exp=None, specific_greek=None):
+async def generate_plots(specific_ticker=None, specific_exp=None, specific_greek=None, changed=None):
+    started = perf_counter()
     timestamp = datetime.now(ZoneInfo(TZ)).strftime("%Y%m%d_%H%M%S")
     #print(f"Generating plots at {timestamp}")
-    sensor()
 
     tickers = [specific_ticker] if specific_ticker else TICKERS
     expirations = [specific_exp] if specific_exp else EXPIRATIONS
     greeks = [specific_greek] if specific_greek else GREEKS
+    if changed is not None:
+        # a scheduled cycle only looks at the tickers with a new snapshot
+        tickers = [ticker for ticker in tickers if ticker_key(ticker) in changed]
 
-    for ticker in tickers:
-        for exp in expirations:
-            if exp == "1dte":
-                today = datetime.now(ZoneInfo(TZ)).date()
-                if "Fri" in datetime.now(ZoneInfo("America/New_York")).ctime():
-                    tomorrow = today + timedelta(days=3)
-                else:
-                    tomorrow = today + timedelta(days=1)
-                expir_param = tomorrow.strftime("%Y-%m-%d")
+    # the event loop only awaits: analysis runs on the analysis threads and
+    # rendering in the render processes, both with a bounded number of workers
+    loop = asyncio.get_running_loop()
+    tomorrow = next_trading_day()
+    # with every greek of a view asked for, a montage has them all in one image
+    montage = PLOT_MONTAGE and not specific_greek
+
+    async def view_renders(ticker, exp):
+        version = producer.version(ticker)
+        specs = await loop.run_in_executor(analysis_pool, view_specs, ticker, exp, greeks, tomorrow, version)
+        renders = []
+        for charts in [specs] if montage and specs else [[chart] for chart in specs]:
+            if changed is not None and all(is_posted(spec, digest) for spec, digest in charts):
+                # and leaves out the charts that look like the last ones posted
+                render = None
+            elif montage:
+                render = loop.run_in_executor(get_render_pool((ticker, exp)), render_montage, [spec for spec, _ in charts])
             else:
-                expir_param = exp
+                # a chart goes to the worker that kept its figure from last time
+                spec = charts[0][0]
+                render = loop.run_in_executor(get_render_pool(spec[:4]), render_chart, spec)
+            renders.append((charts, render))
+        return version, renders
 
-            data = analyze_data(ticker.lower(), expir_param)
-            if data[0] is None:
-                #print(f"No data available for {ticker}/{exp}, skipping")
-                #print(f"get_options_data output: {data}")
+    views = [
+        (ticker, exp, asyncio.ensure_future(view_renders(ticker, exp)))
+        for ticker in tickers
+        for exp in expirations
+    ]
+    # uploads start as soon as the first chart is ready and keep their order
+    uploads = []
+    drawn = {}  # version and (key, digest) of the charts of each view
+    for ticker, exp, view in views:
+        try:
+            version, renders = await view
+        except Exception as e:
+            print(f"Error processing {ticker}/{exp}: {e}")
+            continue
+        for charts, render in renders:
+            for spec, digest in charts:
+                drawn.setdefault(spec[:3], (version, []))[1].append((spec[:4], digest))
+            if render is None:
                 continue
-            (
-                df,
-                today_ddt,
-                today_ddt_string,
-                monthly_options_dates,
-                spot_price,
-                from_strike,
-                to_strike,
-                levels,
-                totaldelta,
-                totalgamma,
-                totalvanna,
-                totalcharm,
-                zerodelta,
-                zerogamma,
-                call_ivs,
-                put_ivs,
-            ) = data
-
-            if not isinstance(df, pd.DataFrame) or df.empty:
-                #print(f"Invalid or empty DataFrame for {ticker}/{exp}, skipping")
-                #print(f"get_options_data output: {data[0:7]}")
-                #print(f"monthly_options_dates: {data[3]}")
-                continue
-            #print(f"df columns: {df.columns}, index type: {type(df.index)}")
-            #print(f"from_strike: {from_strike}, to_strike: {to_strike}")
-            #print(f"call_ivs: {call_ivs}, put_ivs: {put_ivs}")
-            #print(f"totaldelta: {totaldelta}, totalgamma: {totalgamma}")
-
-            for greek in greeks:
-                for value in VISUALIZATIONS[greek]:
-                    #print(f"Processing {ticker}/{exp}/{greek}/{value}")
-                    if value == "Implied Volatility Average" and greek == "vanna" and (exp == "0dte" or exp=="1dte"):
-                        continue
-
-                    try:
-                        date_condition = "Profile" not in value and value != "Implied Volatility Average"
-                        if date_condition:
-                            if not isinstance(from_strike, (int, float)) or not isinstance(to_strike, (int, float)):
-                                #print(f"Invalid from_strike/to_strike for {ticker}/{exp}, skipping")
-                                continue
-                            df_agg = df.groupby(["strike_price"]).sum(numeric_only=True)
-                            #print(f"df_agg index type: {type(df_agg.index)}, index values: {df_agg.index[:5]}")
-                            lower_strike = max(int(spot_price - 300), df_agg.index.min())
-                            upper_strike = min(int(spot_price + 300), df_agg.index.max())
-                            strikes = np.arange(lower_strike, upper_strike + 5, 5)
-                            df_agg = df_agg.reindex(strikes, method='ffill').fillna(0)
-                            if df_agg.empty:
-                                #print(f"Empty df_agg after slicing for {ticker}/{exp}, skipping")
-                                continue
-                        else:
-                            df_agg = df.groupby(["expiration_date"]).sum(numeric_only=True)
-                            #print(f"df_agg index type: {type(df_agg.index)}, index values: {df_agg.index[:5]}")
-                            if df_agg.empty:
-                                #print(f"Empty df_agg for {ticker}/{exp}, skipping")
-                                continue
-
-                        if "Calls/Puts" in value or value == "Implied Volatility Average":
-                            key = "strike" if date_condition else "exp"
-                            if not (isinstance(call_ivs, dict) and isinstance(put_ivs, dict) and
-                                    key in call_ivs and key in put_ivs):
-                                #print(f"Invalid call_ivs/put_ivs for {ticker}/{exp}/{value}, skipping")
-                                continue
-                            call_ivs_data, put_ivs_data = call_ivs[key], put_ivs[key]
-                        else:
-                            call_ivs_data, put_ivs_data = None, None
-
-                        if "Profile" in value and exp == "0dte" and len(df_agg.index) <= 1:
-                            #print(f"Skipping {ticker}/{exp}/{value}: insufficient expiration dates for Profile plot")
-                            continue
-
-                        name = value.split()[1] if "Absolute" in value else value.split()[0]
-                        name_to_vals = {
-                            "Delta": (f"per 1% {ticker} Move", f"{name} Exposure (price / 1% move)", zerodelta),
-                            "Gamma": (f"per 1% {ticker} Move", f"{name} Exposure (delta / 1% move)", zerogamma),
-                            "Vanna": (f"per 1% {ticker} IV Move", f"{name} Exposure (delta / 1% IV move)", 0),
-                            "Charm": (f"a day til {ticker} Expiry", f"{name} Exposure (delta / day til expiry)", 0),
-                            "Implied": ("", "Implied Volatility (IV) Average", 0),
-                        }
-                        description, y_title, zeroflip = name_to_vals[name]
-                        scale = 10**9
-
-                        plt.figure(figsize=(10, 6))
-                        title = f"{ticker} {value}, {today_ddt_string} for {exp}"
-                        plt.title(title.replace("<br>", " "))
-                        plt.grid(True)
-
-                        if "Absolute" in value:
-                            plt.bar(
-                                df_agg.index,
-                                df_agg[f"total_{name.lower()}"],
-                                width=4,
-                                label=f"{name} Exposure",
-                                alpha=0.8,
-                                color="#2B5078",
-                            )
-                        elif "Calls/Puts" in value:
-                            plt.bar(
-                                df_agg.index,
-                                df_agg[f"call_{name[:1].lower()}ex"] / scale,
-                                width=4,
-                                label=f"Call {name}",
-                                alpha=0.8,
-                                color="#2B5078",
-                            )
-                            plt.bar(
-                                df_agg.index,
-                                df_agg[f"put_{name[:1].lower()}ex"] / scale,
-                                width=4,
-                                label=f"Put {name}",
-                                alpha=0.8,
-                                color="#9B5C30",
-                            )
-                        elif value == "Implied Volatility Average":
-                            plt.plot(
-                                df_agg.index,
-                                put_ivs_data * 100,
-                                label="Put IV",
-                                color="#C44E52",
-                            )
-                            plt.fill_between(df_agg.index, put_ivs_data * 100, alpha=0.3, color="#C44E52")
-                            plt.plot(
-                                df_agg.index,
-                                call_ivs_data * 100,
-                                label="Call IV",
-                                color="#32A3A3",
-                            )
-                            plt.fill_between(df_agg.index, call_ivs_data * 100, alpha=0.3, color="#32A3A3")
-                        else:
-                            name_to_vals = {
-                                "Delta": (totaldelta["all"], totaldelta["ex_next"], totaldelta["ex_fri"]),
-                                "Gamma": (totalgamma["all"], totalgamma["ex_next"], totalgamma["ex_fri"]),
-                                "Vanna": (totalvanna["all"], totalvanna["ex_next"], totalvanna["ex_fri"]),
-                                "Charm": (totalcharm["all"], totalcharm["ex_next"], totalcharm["ex_fri"]),
-                            }
-                            all_ex, ex_next, ex_fri = name_to_vals[name]
-                            if not (all_ex.size > 0 and ex_next.size > 0 and ex_fri.size > 0):
-                                #print(f"Invalid profile data for {ticker}/{exp}/{value}: empty arrays")
-                                continue
-                            plt.plot(levels, all_ex, label="All Expiries")
-                            plt.plot(levels, ex_fri, label="Next Monthly Expiry")
-                            plt.plot(levels, ex_next, label="Next Expiry")
-                            if name in ["Charm", "Vanna"]:
-                                all_ex_min, all_ex_max = all_ex.min(), all_ex.max()
-                                min_n = [all_ex_min, ex_fri.min() if ex_fri.size != 0 else all_ex_min, ex_next.min() if ex_next.size != 0 else all_ex_min]
-                                max_n = [all_ex_max, ex_fri.max() if ex_fri.size != 0 else all_ex_max, ex_next.max() if ex_next.size != 0 else all_ex_max]
-                                min_n.sort()
-                                max_n.sort()
-                                if min_n[0] < 0:
-                                    plt.axhspan(0, min_n[0] * 1.5, facecolor="red", alpha=0.1)
-                                if max_n[2] > 0:
-                                    plt.axhspan(0, max_n[2] * 1.5, facecolor="green", alpha=0.1)
-                                plt.axhline(y=0, color="dimgray", linestyle="--", label=f"{name} Flip")
-                            elif zeroflip > 0:
-                                plt.axvline(x=zeroflip, color="dimgray", linestyle="--", label=f"{name} Flip: {zeroflip:,.0f}")
-                                plt.axvspan(from_strike, zeroflip, facecolor="red", alpha=0.1)
-                                plt.axvspan(zeroflip, to_strike, facecolor="green", alpha=0.1)
-
-                        if date_condition:
-                            val = ((spot_price // 50) + 1) * 50
-                            plt.axvline(x=spot_price, color="#707070", linestyle="--", label=f"{ticker} Spot: {spot_price:,.2f}")
-                            plt.xlim(val - 300, val + 300)
-                            x_ticks = np.arange(int(val - 300), int(val + 305), 50)
-                            plt.xticks(x_ticks, [f"{int(x)}" for x in x_ticks])
-                        else:
-                            plt.xlim(today_ddt, today_ddt + timedelta(days=31))
-
-                        plt.xlabel("Strike" if date_condition else "Date")
-                        plt.ylabel(y_title)
-                        plt.legend()
-                        today = datetime.now(ZoneInfo(TZ)).date()
-                        if "Fri" in datetime.now(ZoneInfo("America/New_York")).ctime():
-                            tomorrow = today + timedelta(days=3)
-                        else:
-                            tomorrow = today + timedelta(days=1)
-                        date_formats = {
-                            "monthly": monthly_options_dates[0].strftime("%Y %b") if monthly_options_dates else "N/A",
-                            "opex": monthly_options_dates[1].strftime("%Y %b %d") if len(monthly_options_dates) > 1 else "N/A",
-                            "0dte": monthly_options_dates[0].strftime("%Y %b %d") if monthly_options_dates else "N/A",
-                            "1dte": tomorrow.strftime("%Y %b %d"),
-                            "all": "All Expirations",
-                        }
-                        plt.legend(title=date_formats.get(exp, "All Expirations"))
-
-                        value = value.replace('Calls/Puts', 'Calls Puts')
-                        filename = f"{PLOT_DIR}/{ticker}/{exp}/{greek}/{value.replace(' ', '_')}/{timestamp}.png"
-                        makedirs(os.path.dirname(filename), exist_ok=True)
-                        plt.savefig(filename, bbox_inches="tight")
-                        plt.close()
-                        print(f"Gráfico guardado: {filename}")
-
-                        await send_plot_to_discord(filename, ticker, exp, greek)
-                        shutil.rmtree(PLOT_DIR)
-
-                    except Exception as e:
-                        print(f"Error processing {ticker}/{exp}/{greek}/{value}: {e}")
-
-    if not (specific_ticker or specific_exp or specific_greek):
-        await asyncio.sleep(1)
-        cleanup_timestamp_directory(timestamp)
+            spec = charts[0][0]
+            name = f"{ticker}/{exp}" if montage else f"{ticker}/{exp}/{spec.greek}/{spec.value}"
+            try:
+                png = await render
+                if montage:
+                    value, folder = "Montage", f"{ticker}/{exp}"
+                else:
+                    value = spec.value.replace('Calls/Puts', 'Calls Puts').replace(' ', '_')
+                    folder = f"{ticker}/{exp}/{spec.greek}/{value}"
+                if PLOT_ARCHIVE_DIR:
+                    path = f"{PLOT_ARCHIVE_DIR}/{folder}/{timestamp}.png"
+                    loop.run_in_executor(analysis_pool, archive_plot, png, path)
+                    print(f"Gráfico guardado: {path}")
+                if montage:
+                    sent = await send_montage_to_discord(png, f"{value}_{timestamp}.png", ticker, exp)
+                else:
+                    sent = await send_plot_to_discord(png, f"{value}_{timestamp}.png", spec.ticker, spec.exp, spec.greek)
+                if sent is not None:
+                    uploads.append((charts, sent))
+            except Exception as e:
+                print(f"Error processing {name}: {e}")
+    # the cycle ends once its charts are posted
+    for charts, sent in uploads:
+        posted = await sent
+        if posted is not None:
+            for spec, digest in charts:
+                posted_charts[spec[:4]] = PostedChart(digest, posted.message_url, posted.attachment_url, monotonic())
+    for view, (version, charts) in drawn.items():
+        if all(key in posted_charts and posted_charts[key].digest == digest for key, digest in charts):
+            posted_views[view] = (version, charts)
+    observe("plot_job_seconds", perf_counter() - started)
+
+def is_posted(spec, digest):
+    last = posted_charts.get(spec[:4])
+    return last is not None and last.digest == digest
+
+async def load_plots(ticker, exp, greek):
+    # a $load request, run ahead of the sweep and shared with the same
+    # requests made while it is queued or running
+    await plot_jobs.submit((ticker, exp, greek), INTERACTIVE, partial(generate_plots, ticker, exp, greek))
+
+async def sweep_plots(changed):
+    # the scheduled cycle, one job per view so a $load waits for the jobs
+    # already running at most
+    started = perf_counter()
+    # a montage job posts every greek of its view
+    greeks = [None] if PLOT_MONTAGE else GREEKS
+    jobs = [
+        plot_jobs.submit((ticker, exp, greek), SWEEP, partial(generate_plots, ticker, exp, greek, changed))
+        for ticker in TICKERS
+        if ticker_key(ticker) in changed
+        for exp in EXPIRATIONS
+        for greek in greeks
+    ]
+    for job in jobs:
+        try:
+            await job
+        except Exception as e:
+            print(f"Error in plot job: {type(e).__name__} - {e}")
+    observe("plot_cycle_seconds", perf_counter() - started)
+
+def posted_view(ticker, exp, greek):
+    # the charts of a view already posted from the current snapshot, None
+    # when they have to be generated again
+    version = producer.version(ticker)
+    view = posted_views.get((ticker, exp, greek))
+    if version is None or view is None or view[0] != version:
+        return None
+    charts = [posted_charts.get(key) for key, _ in view[1]]
+    for chart, (_, digest) in zip(charts, view[1]):
+        if chart is None or chart.digest != digest or monotonic() - chart.posted_at > ATTACHMENT_MAX_AGE:
+            return None
+    return charts
+
+plot_cycle = None
+# tickers with a new snapshot not yet posted
+pending_changes = set()
+pending_lock = Lock()
 
 def start_scheduler():
-    sched = BackgroundScheduler(daemon=True)
-    sched.add_job(
-        lambda: asyncio.run_coroutine_threadsafe(generate_plots(), discord_client.loop).result(),
-        CronTrigger.from_crontab("0,5,10,15,20,25,30,35,40,45,50,55 8-17 * * 0-4", timezone=ZoneInfo("America/New_York")),
-    )
-    print("Scheduler started: Generating plots every minute for testing")
-    sched.start()
+    # post after every refresh of the producer, every 5 minutes from 8 to 17
+    @producer.subscribe
+    def post_plots(changed):
+        if not changed:
+            print("No new snapshot, skipping this plot cycle")
+            return
+        with pending_lock:
+            pending_changes.update(changed)
+        start_plot_cycle()
+
+    producer.run()
+    print("Scheduler started: Generating plots after every data refresh")
+
+def start_plot_cycle():
+    # hand the cycle to the bot's loop without waiting on it. Tickers that
+    # change while a cycle runs are posted by the next one, started as it ends,
+    # and those that change before the bot is ready once it is
+    global plot_cycle
+    with pending_lock:
+        if discord_client is None or not pending_changes or (plot_cycle is not None and not plot_cycle.done()):
+            return
+        changed = set(pending_changes)
+        pending_changes.clear()
+        plot_cycle = asyncio.run_coroutine_threadsafe(sweep_plots(changed), discord_client.loop)
+    plot_cycle.add_done_callback(lambda _: start_plot_cycle())
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+WORKERS = 4
+
+# a worker process: runs a producer and keeps writing its role to a file
+WORKER = """
+import os, time
+from modules.producer import Producer
+producer = Producer().run()
+while True:
+    role = "leader" if producer.leader else "follower"
+    with open(f"roles/{os.getpid()}", "w") as f:
+        f.write(role)
+    time.sleep(0.05)
+"""
+
+
+def roles(cwd):
+    found = {}
+    for path in (cwd / "roles").iterdir():
+        role = path.read_text()
+        if role:
+            found[int(path.name)] = role
+    return found
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.1)
+    raise AssertionError("timed out")
+
+
+def test_one_leader_and_failover(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "roles").mkdir()
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(ROOT),
+        MANIFEST_POLL="0.2",
+        DATA_PRODUCER="1",
+        REFRESH_CRONTAB="0 0 1 1 *",  # no download during the test
+    )
+    workers = {}
+    try:
+        for _ in range(WORKERS):
+            worker = subprocess.Popen(
+                [sys.executable, "-c", WORKER], cwd=tmp_path, env=env
+            )
+            workers[worker.pid] = worker
+
+        found = wait_for(lambda: len(roles(tmp_path)) == WORKERS and roles(tmp_path))
+        leaders = [pid for pid, role in found.items() if role == "leader"]
+        assert len(leaders) == 1
+
+        # the os releases the lock with the leader, a follower takes it over
+        # on its next manifest poll
+        leader = workers.pop(leaders[0])
+        leader.kill()
+        leader.wait()
+        (tmp_path / "roles" / str(leaders[0])).unlink()
+        found = wait_for(
+            lambda: [p for p, r in roles(tmp_path).items() if r == "leader"]
+        )
+        assert len(found) == 1 and found[0] in workers
+        time.sleep(1)  # later polls do not elect a second one
+        assert list(roles(tmp_path).values()).count("leader") == 1
+    finally:
+        for worker in workers.values():
+            worker.kill()
+            worker.wait()
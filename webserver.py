@@ -2,6 +2,7 @@ from flask import Flask
 from threading import Thread
 from bot import run_bot
 from plot_options import start_scheduler
+from modules.metrics import snapshot
 
 app = Flask('')
 
@@ -9,6 +10,10 @@ app = Flask('')
 def index():
     return "App working!"
 
+@app.route('/metrics')
+def metrics():
+    return snapshot()
+
 def run_flask():
     app.run(host='0.0.0.0', port=8000)
 